@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+"""This file is part of the MySQL cluster manager benchmarks"""
+
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import logging
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# pylint: disable=wrong-import-position
+from fake_consul import FakeConsul
+from fake_node import FakeNode
+from mcm.consul import Consul
+
+class FailoverBenchmark:
+    """
+    Measure the end to end latency of a replication leader failover. Each
+    iteration starts a cluster of cluster manager nodes (as processes)
+    against the fakes, kills the replication leader and waits until a new
+    leader is registered and all remaining followers are repointed.
+    """
+
+    def __init__(self, nodes, ttl_grace, ttl_scale, timeout):
+        """
+        Init the benchmark
+        """
+        self.nodes = nodes
+        self.ttl_grace = ttl_grace
+        self.ttl_scale = ttl_scale
+        self.timeout = timeout
+        self.events = multiprocessing.get_context("fork").Queue()
+
+        # The leader registrations and repointings of the running iteration
+        self.leaders = {}
+        self.repointed = {}
+
+    @staticmethod
+    def run_node(ip_address, consul_port, store_directory, events, log_level):
+        """
+        Entry point of the node processes
+        """
+        # The logging configuration is inherited from the benchmark process
+        logging.getLogger().setLevel(log_level)
+        FakeNode(ip_address, consul_port, store_directory, events).run()
+
+    def process_events(self, condition, deadline):
+        """
+        Process the events of the nodes until the condition is met.
+        Returns False on timeout.
+        """
+        while not condition():
+            try:
+                event, node, timestamp, detail = self.events.get(
+                    timeout=max(deadline - time.time(), 0.01))
+            except queue.Empty:
+                return False
+
+            if event == "registered" and detail:
+                self.leaders[node] = timestamp
+            elif event == "repointed":
+                self.repointed[node] = (detail, timestamp)
+
+        return True
+
+    def is_following(self, leader_ip, followers):
+        """
+        Are all followers repointed to the leader?
+        """
+        return all(self.repointed.get(node, (None, None))[0] == leader_ip for node in followers)
+
+    def get_new_leader(self, old_leader_ip):
+        """
+        Get the first node registered as leader after the old leader
+        """
+        new_leaders = [node for node in self.leaders if node != old_leader_ip]
+
+        if not new_leaders:
+            return None
+
+        return min(new_leaders, key=lambda node: self.leaders[node])
+
+    def run_iteration(self, log_level):
+        """
+        Run one failover. Returns the detection, promotion and
+        repointing latencies in seconds (None on timeout).
+        """
+        fake_consul = FakeConsul(ttl_grace=self.ttl_grace, ttl_scale=self.ttl_scale)
+        consul_port = fake_consul.start()
+
+        invalidations = {}
+        fake_consul.invalidation_listeners.append(invalidations.setdefault)
+
+        context = multiprocessing.get_context("fork")
+        processes = {}
+        ip_addresses = [f"10.0.0.{node + 1}" for node in range(self.nodes)]
+        leader_ip = ip_addresses[0]
+        followers = ip_addresses[1:]
+
+        self.leaders = {}
+        self.repointed = {}
+
+        with tempfile.TemporaryDirectory() as store_directory:
+            try:
+                deadline = time.time() + self.timeout
+
+                # The first node bootstraps the cluster
+                for ip_address in ip_addresses:
+                    process = context.Process(target=FailoverBenchmark.run_node,
+                                              args=(ip_address, consul_port, store_directory,
+                                                    self.events, log_level), daemon=True)
+                    process.start()
+                    processes[ip_address] = process
+                    self.process_events(lambda: leader_ip in self.leaders, deadline)
+
+                if not self.process_events(lambda: self.is_following(leader_ip, followers),
+                                           deadline):
+                    logging.error("Cluster was not ready after %i seconds", self.timeout)
+                    return None
+
+                leader_session = fake_consul.kv_store[Consul.replication_leader_path]['Session']
+
+                # Kill the replication leader
+                kill_time = time.time()
+                os.kill(processes[leader_ip].pid, signal.SIGKILL)
+                logging.info("Replication leader %s killed", leader_ip)
+
+                def is_failover_done():
+                    new_leader_ip = self.get_new_leader(leader_ip)
+                    return new_leader_ip is not None and self.is_following(
+                        new_leader_ip, [node for node in followers if node != new_leader_ip])
+
+                if not self.process_events(is_failover_done, time.time() + self.timeout):
+                    logging.error("Failover not completed after %i seconds", self.timeout)
+                    return None
+
+                new_leader_ip = self.get_new_leader(leader_ip)
+                promotion_time = self.leaders[new_leader_ip]
+
+                # Without remaining followers, the failover ends with the promotion
+                repointing_time = max([promotion_time] + [
+                    self.repointed[node][1] for node in followers if node != new_leader_ip])
+
+                return {'detection': invalidations[leader_session] - kill_time,
+                        'promotion': promotion_time - kill_time,
+                        'repointing': repointing_time - kill_time}
+            finally:
+                for process in processes.values():
+                    if process.is_alive():
+                        process.kill()
+                    process.join()
+
+                fake_consul.stop()
+                self.drain_events()
+
+    def drain_events(self):
+        """
+        Remove the events of the last iteration from the queue
+        """
+        while True:
+            try:
+                self.events.get(timeout=0.1)
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def get_percentile(values, percentile):
+        """
+        Get the percentile of the values (nearest rank)
+        """
+        values = sorted(values)
+        rank = max(int(round(percentile / 100 * len(values) + 0.5)) - 1, 0)
+        return values[min(rank, len(values) - 1)]
+
+    def run(self, iterations, log_level):
+        """
+        Run the benchmark and log the latency percentiles
+        """
+        results = []
+
+        for iteration in range(iterations):
+            logging.info("Running failover iteration %i of %i", iteration + 1, iterations)
+            result = self.run_iteration(log_level)
+
+            if result is None:
+                continue
+
+            logging.info("Failover latencies (detection=%.2fs, promotion=%.2fs, repointing=%.2fs)",
+                         result['detection'], result['promotion'], result['repointing'])
+            results.append(result)
+
+        if not results:
+            logging.error("No failover was completed")
+            return None
+
+        summary = {}
+
+        logging.info("Failover benchmark results (nodes=%i, iterations=%i, completed=%i)",
+                     self.nodes, iterations, len(results))
+        logging.info("%-11s %8s %8s %8s %8s", "phase", "p50", "p90", "p99", "max")
+
+        for phase in ('detection', 'promotion', 'repointing'):
+            values = [result[phase] for result in results]
+            summary[phase] = {f"p{percentile}": FailoverBenchmark.get_percentile(values, percentile)
+                              for percentile in (50, 90, 99)}
+            summary[phase]['max'] = max(values)
+
+            logging.info("%-11s %7.2fs %7.2fs %7.2fs %7.2fs", phase, summary[phase]['p50'],
+                         summary[phase]['p90'], summary[phase]['p99'], summary[phase]['max'])
+
+        return summary
+
+
+def main():
+    """
+    Parse the arguments and run the benchmark
+    """
+    parser = argparse.ArgumentParser(description="MySQL cluster manager failover benchmark")
+
+    log_levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+    parser.add_argument('--log-level', default='INFO', choices=log_levels)
+    parser.add_argument('--node-log-level', default='WARNING', choices=log_levels,
+                        help='Log level of the cluster manager nodes')
+    parser.add_argument('--nodes', default=3, type=int, help='Number of nodes (at least 2)')
+    parser.add_argument('--iterations', default=5, type=int, help='Number of failovers')
+    parser.add_argument('--ttl-grace', default=2.0, type=float,
+                        help='Sessions are invalidated after ttl * ttl-grace seconds')
+    parser.add_argument('--ttl-scale', default=1.0, type=float,
+                        help='Scale factor for the session TTLs (e.g., 0.1 for quick runs)')
+    parser.add_argument('--timeout', default=120, type=int,
+                        help='Timeout of the cluster startup and the failover in seconds')
+    parser.add_argument('--output', help='Write the percentiles as JSON to this file')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level,
+                        format='%(asctime)-15s %(levelname)s %(message)s')
+
+    if args.nodes < 2:
+        logging.error("At least two nodes are needed for a failover")
+        sys.exit(1)
+
+    benchmark = FailoverBenchmark(args.nodes, args.ttl_grace, args.ttl_scale, args.timeout)
+    summary = benchmark.run(args.iterations, args.node_log_level)
+
+    if summary is None:
+        sys.exit(1)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(summary, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
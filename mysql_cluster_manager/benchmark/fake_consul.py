@@ -0,0 +1,424 @@
+"""This file is part of the MySQL cluster manager benchmarks"""
+
+import json
+import time
+import uuid
+import base64
+import logging
+import threading
+
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeConsul:
+    """
+    An in-process stand-in for the Consul HTTP API. Only the endpoints
+    used by the cluster manager are implemented (KV store with blocking
+    queries, sessions with TTL, transactions, agent services).
+    """
+
+    def __init__(self, ttl_grace=2.0, ttl_scale=1.0):
+        """
+        Init the fake. Sessions are invalidated after ttl * ttl_grace
+        seconds without renewal (Consul invalidates sessions around 2*ttl).
+        The ttl_scale factor can be used to shorten all TTLs.
+        """
+        self.ttl_grace = ttl_grace
+        self.ttl_scale = ttl_scale
+
+        self.index = 1
+        self.kv_store = {}
+        self.sessions = {}
+        self.services = {}
+        self.condition = threading.Condition()
+
+        # Callbacks called with (session_id, timestamp) on session invalidation
+        self.invalidation_listeners = []
+
+        self.server = None
+        self.server_thread = None
+        self.reaper_thread = None
+        self.run_reaper = False
+
+    def start(self, port=0):
+        """
+        Start the HTTP server and the session reaper. Returns the port.
+        """
+        fake = self
+
+        class Handler(FakeConsulHandler):
+            """
+            Request handler bound to this fake
+            """
+            consul = fake
+
+        self.server = FakeConsulServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+        self.run_reaper = True
+        self.reaper_thread = threading.Thread(target=self.reap_sessions, daemon=True)
+        self.reaper_thread.start()
+
+        return self.server.server_address[1]
+
+    def stop(self):
+        """
+        Stop the HTTP server and the session reaper
+        """
+        self.run_reaper = False
+        self.server.shutdown()
+        self.server.server_close()
+
+        with self.condition:
+            self.condition.notify_all()
+
+    def next_index(self):
+        """
+        Increment the raft index (caller holds the condition)
+        """
+        self.index = self.index + 1
+        self.condition.notify_all()
+        return self.index
+
+    def create_session(self, name, behavior, ttl, lock_delay):
+        """
+        Create a new session
+        """
+        with self.condition:
+            session_id = str(uuid.uuid4())
+            self.sessions[session_id] = {'ID': session_id, 'Name': name,
+                                         'Behavior': behavior, 'TTL': ttl,
+                                         'LockDelay': lock_delay,
+                                         'expires': self.get_expiry(ttl)}
+            self.next_index()
+            return session_id
+
+    def get_expiry(self, ttl):
+        """
+        Get the invalidation time of a session renewed now
+        """
+        if ttl is None:
+            return None
+
+        return time.time() + ttl * self.ttl_scale * self.ttl_grace
+
+    def renew_session(self, session_id):
+        """
+        Renew the session, returns None if the session is unknown
+        """
+        with self.condition:
+            session = self.sessions.get(session_id)
+
+            if session is None:
+                return None
+
+            session['expires'] = self.get_expiry(session['TTL'])
+            return session
+
+    def destroy_session(self, session_id):
+        """
+        Destroy the session and release or delete its locks
+        """
+        with self.condition:
+            session = self.sessions.pop(session_id, None)
+
+            if session is None:
+                return False
+
+            for key, entry in list(self.kv_store.items()):
+                if entry['Session'] != session_id:
+                    continue
+
+                if session['Behavior'] == 'delete':
+                    del self.kv_store[key]
+                else:
+                    entry['Session'] = None
+                    entry['ModifyIndex'] = self.index + 1
+
+            self.next_index()
+
+        return True
+
+    def reap_sessions(self):
+        """
+        Invalidate the sessions with an expired TTL
+        """
+        while self.run_reaper:
+            now = time.time()
+
+            with self.condition:
+                expired = [session_id for session_id, session in self.sessions.items()
+                           if session['expires'] is not None and session['expires'] < now]
+
+            for session_id in expired:
+                logging.debug("Session %s is expired", session_id)
+                self.destroy_session(session_id)
+
+                for listener in self.invalidation_listeners:
+                    listener(session_id, now)
+
+            time.sleep(0.05)
+
+    def get_entries(self, key, recurse, index, wait):
+        """
+        Get the KV entries (blocking query, if index is given)
+        """
+        deadline = time.time() + wait
+
+        with self.condition:
+            while index is not None and self.index <= index and time.time() < deadline:
+                self.condition.wait(timeout=deadline - time.time())
+
+            if recurse:
+                entries = [entry for entry_key, entry in sorted(self.kv_store.items())
+                           if entry_key.startswith(key)]
+            else:
+                entries = [self.kv_store[key]] if key in self.kv_store else []
+
+            return (self.index, [FakeConsul.encode_entry(entry) for entry in entries])
+
+    @staticmethod
+    def encode_entry(entry):
+        """
+        Get the JSON representation of a KV entry
+        """
+        result = dict(entry)
+        result['Value'] = base64.b64encode(entry['Value']).decode()
+        return result
+
+    def put_entry(self, key, value, cas=None, acquire=None, release=None):
+        """
+        Store a KV entry (with check-and-set or lock acquisition)
+        """
+        with self.condition:
+            entry = self.kv_store.get(key)
+
+            if cas is not None:
+                if cas == 0 and entry is not None:
+                    return False
+
+                if cas != 0 and (entry is None or entry['ModifyIndex'] != cas):
+                    return False
+
+            if acquire is not None:
+                if acquire not in self.sessions:
+                    return False
+
+                if entry is not None and entry['Session'] not in (None, acquire):
+                    return False
+
+            if release is not None and (entry is None or entry['Session'] != release):
+                return False
+
+            index = self.next_index()
+
+            if entry is None:
+                entry = {'Key': key, 'Flags': 0, 'Session': None,
+                         'LockIndex': 0, 'CreateIndex': index}
+                self.kv_store[key] = entry
+
+            entry['Value'] = value
+            entry['ModifyIndex'] = index
+
+            if acquire is not None and entry['Session'] is None:
+                entry['Session'] = acquire
+                entry['LockIndex'] = entry['LockIndex'] + 1
+
+            if release is not None:
+                entry['Session'] = None
+
+            return True
+
+    def delete_entries(self, key, recurse):
+        """
+        Delete a KV entry or a KV prefix
+        """
+        with self.condition:
+            for entry_key in list(self.kv_store):
+                if entry_key == key or (recurse and entry_key.startswith(key)):
+                    del self.kv_store[entry_key]
+
+            self.next_index()
+
+    def execute_transaction(self, operations):
+        """
+        Execute the set, cas, and delete operations of a transaction atomically
+        """
+        with self.condition:
+            for operation in operations:
+                kv_operation = operation['KV']
+                entry = self.kv_store.get(kv_operation['Key'])
+
+                if kv_operation['Verb'] != 'cas':
+                    continue
+
+                version = kv_operation['Index']
+                if (version == 0 and entry is not None) or \
+                    (version != 0 and (entry is None or entry['ModifyIndex'] != version)):
+                    return False
+
+            for operation in operations:
+                kv_operation = operation['KV']
+
+                if kv_operation['Verb'] == 'delete':
+                    self.delete_entries(kv_operation['Key'], False)
+                    continue
+
+                value = base64.b64decode(kv_operation['Value'])
+                self.put_entry(kv_operation['Key'], value)
+
+            return True
+
+
+class FakeConsulServer(ThreadingHTTPServer):
+    """
+    The HTTP server of the fake Consul API
+    """
+
+    def handle_error(self, request, client_address):
+        """
+        Clients are killed during the benchmark, ignore broken connections
+        """
+        logging.debug("Connection to %s closed", client_address)
+
+
+class FakeConsulHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP handler of the fake Consul API
+    """
+
+    # The fake, set by FakeConsul.start()
+    consul = None
+
+    # Use keep-alive connections like the real agent
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """
+        Suppress the access log
+        """
+
+    def send_json(self, data, status=200, index=None):
+        """
+        Send a JSON response
+        """
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+
+        if index is not None:
+            self.send_header("X-Consul-Index", str(index))
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        """
+        Read the request body
+        """
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length > 0 else b""
+
+    @staticmethod
+    def parse_duration(value):
+        """
+        Parse a Consul duration (e.g., 15s)
+        """
+        if value is None:
+            return None
+
+        if value.endswith("ms"):
+            return float(value[:-2]) / 1000
+
+        return float(value.rstrip("s"))
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """
+        Handle GET requests
+        """
+        url = urlparse(self.path)
+        params = parse_qs(url.query, keep_blank_values=True)
+
+        if url.path == "/v1/status/leader":
+            self.send_json("127.0.0.1:8300")
+        elif url.path == "/v1/agent/services":
+            self.send_json(self.consul.services)
+        elif url.path.startswith("/v1/kv/"):
+            key = url.path[len("/v1/kv/"):]
+            index = int(params["index"][0]) if "index" in params else None
+            wait = FakeConsulHandler.parse_duration(params.get("wait", ["300s"])[0])
+            index, entries = self.consul.get_entries(key, "recurse" in params, index, wait)
+
+            if not entries:
+                self.send_json(None, status=404, index=index)
+            else:
+                self.send_json(entries, index=index)
+        else:
+            self.send_json(None, status=404)
+
+    def do_PUT(self): # pylint: disable=invalid-name
+        """
+        Handle PUT requests
+        """
+        url = urlparse(self.path)
+        params = parse_qs(url.query, keep_blank_values=True)
+        body = self.read_body()
+
+        if url.path == "/v1/session/create":
+            data = json.loads(body) if body else {}
+            session_id = self.consul.create_session(
+                data.get("name"), data.get("behavior", "release"),
+                FakeConsulHandler.parse_duration(data.get("ttl")),
+                FakeConsulHandler.parse_duration(data.get("lockdelay", "15s")))
+            self.send_json({"ID": session_id})
+        elif url.path.startswith("/v1/session/renew/"):
+            session = self.consul.renew_session(url.path[len("/v1/session/renew/"):])
+
+            if session is None:
+                self.send_json(None, status=404)
+            else:
+                self.send_json([{key: value for key, value in session.items()
+                                 if key != 'expires'}])
+        elif url.path.startswith("/v1/session/destroy/"):
+            self.send_json(self.consul.destroy_session(url.path[len("/v1/session/destroy/"):]))
+        elif url.path.startswith("/v1/kv/"):
+            key = url.path[len("/v1/kv/"):]
+            cas = int(params["cas"][0]) if "cas" in params else None
+            acquire = params["acquire"][0] if "acquire" in params else None
+            release = params["release"][0] if "release" in params else None
+            self.send_json(self.consul.put_entry(key, body, cas=cas, acquire=acquire,
+                                                 release=release))
+        elif url.path == "/v1/txn":
+            if self.consul.execute_transaction(json.loads(body)):
+                self.send_json({"Results": [], "Errors": None})
+            else:
+                self.send_json({"Results": None, "Errors": [{"What": "cas failed"}]},
+                               status=409)
+        elif url.path == "/v1/agent/service/register":
+            service = json.loads(body)
+            service_id = service.get("id", service.get("name"))
+            self.consul.services[service_id] = {"ID": service_id, "Service": service.get("name"),
+                                                "Tags": service.get("tags", []),
+                                                "Port": service.get("port")}
+            self.send_json(None)
+        elif url.path.startswith("/v1/agent/service/deregister/"):
+            self.consul.services.pop(url.path[len("/v1/agent/service/deregister/"):], None)
+            self.send_json(None)
+        else:
+            self.send_json(None, status=404)
+
+    def do_DELETE(self): # pylint: disable=invalid-name
+        """
+        Handle DELETE requests
+        """
+        url = urlparse(self.path)
+        params = parse_qs(url.query, keep_blank_values=True)
+
+        if url.path.startswith("/v1/kv/"):
+            self.consul.delete_entries(url.path[len("/v1/kv/"):], "recurse" in params)
+            self.send_json(True)
+        else:
+            self.send_json(None, status=404)
@@ -0,0 +1,225 @@
+"""This file is part of the MySQL cluster manager benchmarks"""
+
+import os
+import json
+import time
+import logging
+
+from datetime import datetime, timezone
+
+from mcm.actions import Actions
+from mcm.binlog import BinlogArchive
+from mcm.catalog import BackupCatalog
+from mcm.consul import Consul
+from mcm.minio import Minio
+from mcm.mysql import Mysql
+from mcm.proxysql import Proxysql
+from mcm.utils import Utils
+from mcm.verification import BackupVerification
+
+class FakeObjectStore:
+    """
+    A stand-in for the MinIO bucket. Objects are stored as files in
+    a directory, so the store is shared by all node processes.
+    """
+
+    def __init__(self, directory):
+        """
+        Init the store
+        """
+        self.directory = directory
+
+    def get_path(self, object_name):
+        """
+        Get the file of the object
+        """
+        return f"{self.directory}/{object_name}"
+
+    def get_backups(self):
+        """
+        Same as Minio.get_backups()
+        """
+        backups = []
+
+        for object_name in sorted(os.listdir(self.directory)):
+            if object_name.startswith("mysql_backup_") and not object_name.endswith(".json"):
+                modified = os.path.getmtime(self.get_path(object_name))
+                backups.append((object_name, datetime.fromtimestamp(modified, timezone.utc)))
+
+        return backups
+
+    def put_object(self, object_name, data):
+        """
+        Store the data as the given object
+        """
+        with open(self.get_path(object_name), "wb") as object_file:
+            object_file.write(data)
+
+        return True
+
+    def write_chain_record(self, record):
+        """
+        Same as Minio.write_chain_record()
+        """
+        return self.put_object(f"{record['name']}.json", json.dumps(record).encode())
+
+    def read_chain_record(self, backup_name):
+        """
+        Same as Minio.read_chain_record()
+        """
+        filename = self.get_path(f"{backup_name}.json")
+
+        if not os.path.isfile(filename):
+            return None
+
+        with open(filename, "rb") as record_file:
+            return json.loads(record_file.read())
+
+    def remove_object(self, object_name):
+        """
+        Same as Minio.remove_object()
+        """
+        if os.path.isfile(self.get_path(object_name)):
+            os.remove(self.get_path(object_name))
+
+        return True
+
+    def remove_objects(self, object_names):
+        """
+        Same as Minio.remove_objects()
+        """
+        for object_name in object_names:
+            self.remove_object(object_name)
+
+        return True
+
+
+class FakeProcess:
+    """
+    A stand-in for the Consul agent and mysqld processes
+    """
+
+    @staticmethod
+    def poll():
+        """
+        The process is always running
+        """
+        return None
+
+
+class FakeNode:
+    """
+    A cluster manager node that runs the real main event loop against
+    fakes of the Consul agent, mysqld, ProxySQL and the object store.
+    The failover relevant actions are reported to the events queue.
+    """
+
+    def __init__(self, ip_address, consul_port, store_directory, events):
+        """
+        Init the node
+        """
+        self.ip_address = ip_address
+        self.consul_port = consul_port
+        self.object_store = FakeObjectStore(store_directory)
+        self.events = events
+
+        # The replication leader configured in the fake mysqld
+        self.configured_leader = None
+
+    def report(self, event, detail=None):
+        """
+        Report an event with the current time to the benchmark
+        """
+        self.events.put((event, self.ip_address, time.time(), detail))
+
+    def install(self):
+        """
+        Replace the external dependencies of the cluster manager with fakes
+        """
+        os.environ['CONSUL_HTTP_ADDR'] = f"127.0.0.1:{self.consul_port}"
+        node = self
+
+        # Network
+        Utils.get_local_ip_address = staticmethod(lambda: node.ip_address)
+
+        # mysqld
+        Mysql.change_to_replication_client = staticmethod(self.change_to_replication_client)
+        Mysql.delete_replication_config = staticmethod(self.delete_replication_config)
+        Mysql.get_replication_leader_ip = staticmethod(lambda: node.configured_leader)
+        Mysql.is_repliation_data_processed = staticmethod(lambda: node.configured_leader is not None)
+        Mysql.get_node_status = staticmethod(lambda: {
+            'replication_lag': 0 if node.configured_leader else None,
+            'replication_running': node.configured_leader is not None,
+            'threads_running': 1,
+            'gtid_executed': "",
+            'retrieved_gtid_set': ""})
+        Mysql.is_gtid_subset = staticmethod(lambda subset, superset: True)
+        Mysql.backup_data = staticmethod(self.backup_data)
+        BinlogArchive.archive_if_needed = lambda binlog_archive: False
+        BackupVerification.verify_if_needed = staticmethod(lambda: False)
+
+        # ProxySQL
+        Proxysql.update_mysql_server_if_needed = lambda proxysql, node_records, leader_ip: False
+
+        # Object store
+        Minio.setup_connection = staticmethod(lambda: None)
+        Minio.get_backups = staticmethod(self.object_store.get_backups)
+        Minio.write_chain_record = staticmethod(self.object_store.write_chain_record)
+        Minio.read_chain_record = staticmethod(self.object_store.read_chain_record)
+        Minio.remove_object = staticmethod(self.object_store.remove_object)
+        Minio.remove_objects = staticmethod(self.object_store.remove_objects)
+
+        # Report the service registrations
+        register_service = Consul.register_service
+
+        def report_register_service(consul, leader=False, port=3306):
+            register_service(consul, leader=leader, port=port)
+            node.report("registered", leader)
+
+        Consul.register_service = report_register_service
+
+    def change_to_replication_client(self, leader_ip):
+        """
+        Follow the given replication leader
+        """
+        self.configured_leader = leader_ip
+        self.report("repointed", leader_ip)
+
+    def delete_replication_config(self):
+        """
+        Stop the replication
+        """
+        self.configured_leader = None
+        self.report("promoted")
+
+    def backup_data(self):
+        """
+        Create a small backup in the object store and the catalog
+        """
+        current_time = time.time()
+        backup_name = f"mysql_backup_{int(current_time)}.xbstream.zst"
+
+        self.object_store.put_object(backup_name, os.urandom(1024))
+
+        record = {'name': backup_name, 'type': 'full', 'base': backup_name,
+                  'parent': None, 'chain_position': 0, 'codec': 'zstd',
+                  'timestamp': current_time}
+
+        self.object_store.write_chain_record(record)
+        return BackupCatalog.add_backup(record)
+
+    def run(self):
+        """
+        Register the node and run the main event loop (never returns)
+        """
+        self.install()
+
+        consul = Consul.get_instance()
+        consul.register_node(mysql_version="8.0.21", server_id=None)
+
+        replication_leader = consul.try_to_become_replication_leader()
+        Mysql.delete_replication_config()
+        consul.register_service(replication_leader)
+
+        logging.info("Node %s started (leader=%s)", self.ip_address, replication_leader)
+        Actions.join_main_event_loop(FakeProcess(), FakeProcess())
@@ -4,13 +4,15 @@ import sys
 import time
 import logging
 
-from datetime import timedelta, datetime
-
+from mcm.catalog import BackupCatalog
 from mcm.consul import Consul
+from mcm.datadir import Datadir
+from mcm.eventloop import EventLoop
+from mcm.metrics import Metrics
 from mcm.minio import Minio
 from mcm.mysql import Mysql
 from mcm.proxysql import Proxysql
-from mcm.utils import Utils
+from mcm.staging import Staging
 
 class Actions:
     """The actions of the application"""
@@ -21,13 +23,17 @@ class Actions:
         Join the existing cluster or bootstrap a new cluster
         """
 
+        # Expose the metrics during the startup (e.g., the restore)
+        Metrics.start_server()
+
         # Start the local consul agent
         consul_process = Consul.agent_start()
+        Consul.wait_for_agent()
 
         # Check if we have an existing backup to restore
         # Use this backup if exists, or init a new MySQL database
         Minio.setup_connection()
-        backup_exists = Minio.does_backup_exists()
+        backup_exists = BackupCatalog.does_backup_exists()
 
         # Test for unstable environment (other nodes are present and no leader is present)
         # We don't want to become the new leader on the restored backup directly
@@ -51,7 +57,22 @@ class Actions:
         logging.info("Init local node (leader=%s, backup=%s)",
                      replication_leader, backup_exists)
 
-        if replication_leader and not backup_exists:
+        # Datadirs of older versions are stored directly in the volume
+        Staging.migrate_datadir(Mysql.mysql_datadir)
+
+        # A restarted node can use its datadir, if it is newer than the latest backup
+        latest_backup = BackupCatalog.get_latest_backup() if backup_exists else None
+        reused = latest_backup is not None and Datadir.is_up_to_date(latest_backup)
+
+        # Followers can copy the data from a running node instead of restoring the backups
+        cloned = not reused and not replication_leader and Datadir.clone_from_donor_if_configured()
+
+        if reused:
+            logging.info("Datadir is newer than backup %s, skipping backup restore",
+                         latest_backup['name'])
+        elif cloned:
+            logging.info("Data cloned from a running node, skipping backup restore")
+        elif replication_leader and not backup_exists:
             Mysql.init_database_if_needed()
         elif replication_leader and backup_exists:
             Mysql.restore_backup_or_exit()
@@ -59,7 +80,7 @@ class Actions:
             Mysql.restore_backup_or_exit()
         elif not replication_leader and not backup_exists:
             logging.info("We are not the replication leader, waiting for backups")
-            backup_exists = Utils.wait_for_backup_exists(Consul.get_instance())
+            backup_exists = BackupCatalog.wait_for_backup_exists()
 
             if not backup_exists:
                 logging.error("No backups to restore available, please check master logs, exiting")
@@ -72,6 +93,9 @@ class Actions:
                           replication_leader, backup_exists)
             sys.exit(1)
 
+        # Remove old datadirs and abandoned restores in the background
+        Staging.start_reaper(Mysql.mysql_datadir)
+
         # Start ProxySQL
         Proxysql.start_proxysql()
 
@@ -105,68 +129,4 @@ class Actions:
         """
         The main event loop for the join_or_bootstrap action
         """
-
-        last_backup_check = None
-        last_session_refresh = None
-        last_replication_leader_check = None
-        able_to_become_leader = False
-
-        proxysql = Proxysql()
-
-        # Main Loop, heavy operations needs to be dispatched
-        # to an extra thread. The loop needs to refresh the
-        # Consul sessions every few seconds.
-        while True:
-            consul_process.poll()
-            mysql_process.poll()
-
-            # Try to replace a failed replication leader
-            if Utils.is_refresh_needed(last_replication_leader_check, timedelta(seconds=5)):
-                last_replication_leader_check = datetime.now()
-
-                # Update ProxySQL nodes
-                mysql_nodes = Consul.get_instance().get_all_registered_nodes()
-                proxysql.update_mysql_server_if_needed(mysql_nodes)
-
-                # Are the replication data completely processed
-                # (i.e., the data from the leader is stored locally and we
-                # can become the new leader?)
-                if not able_to_become_leader:
-                    if Mysql.is_repliation_data_processed():
-                        logging.info("All replication data are read, node can become replication leader")
-                        able_to_become_leader = True
-
-                replication_leader = Consul.get_instance().is_replication_leader()
-
-                # Try to become new leader
-                if not replication_leader and able_to_become_leader:
-                    promotion = Consul.get_instance().try_to_become_replication_leader()
-
-                    # Are we the new leader?
-                    if promotion:
-                        Mysql.delete_replication_config()
-                        Consul.get_instance().register_service(True)
-                        replication_leader = True
-
-                # Check for correct replication leader
-                if not replication_leader:
-                    real_leader = Consul.get_instance().get_replication_leader_ip()
-                    configured_leader = Mysql.get_replication_leader_ip()
-
-                    if real_leader != configured_leader:
-                        logging.info("Replication leader change (old=%s, new=%s)", configured_leader, real_leader)
-                        Mysql.change_to_replication_client(real_leader)
-
-            # Keep Consul sessions alive
-            if Utils.is_refresh_needed(last_session_refresh, timedelta(seconds=5)):
-                Consul.get_instance().refresh_sessions()
-                last_session_refresh = datetime.now()
-
-            # Create MySQL Backups (using extra thread for backup)
-            if Utils.is_refresh_needed(last_backup_check, timedelta(minutes=5)):
-                Consul.get_instance().start_session_auto_refresh_thread()
-                Mysql.create_backup_if_needed()
-                last_backup_check = datetime.now()
-                Consul.get_instance().stop_session_auto_refresh_thread()
-
-            time.sleep(1)
+        EventLoop(consul_process, mysql_process).run()
@@ -0,0 +1,256 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import logging
+import threading
+import subprocess
+
+import mysql.connector
+
+from mcm.codec import Codec
+from mcm.mysql import Mysql
+
+class Benchmark:
+    """
+    This class contains the benchmarks of the cluster manager
+    """
+
+    # Chunk size for reading and writing the sample data
+    chunk_size = 1024 * 1024
+
+    # Database for the replication benchmark (created on the leader)
+    benchmark_database = "mcm_benchmark"
+
+    # Number of client threads generating load on the leader
+    writer_threads = 16
+
+    @staticmethod
+    def run_codec_benchmark(directory, sample_size):
+        """
+        Compress a sample of the given directory with all available
+        codecs. Log and return the compression ratio and the throughput.
+        """
+        logging.info("Reading %i MiB sample from %s", sample_size / (1024 * 1024), directory)
+        sample = Benchmark.read_directory_sample(directory, sample_size)
+        sample_bytes = sum(len(chunk) for chunk in sample)
+
+        if sample_bytes == 0:
+            logging.error("Unable to read sample data from %s", directory)
+            return []
+
+        results = []
+
+        for codec in Codec.get_codecs():
+            if not codec.is_available():
+                logging.warning("Binary %s of codec %s not found, skipping",
+                                codec.binary, codec.name)
+                continue
+
+            logging.info("Benchmarking codec %s", codec.name)
+            compress = codec.get_compress_command(level=Codec.get_configured_level(),
+                                                  threads=Codec.get_configured_threads())
+            compressed, compress_time = Benchmark.measure_command(compress, sample)
+            _, decompress_time = Benchmark.measure_command(codec.get_decompress_command(),
+                                                           compressed)
+            compressed_bytes = sum(len(chunk) for chunk in compressed)
+
+            results.append({
+                'codec': codec.name,
+                'ratio': sample_bytes / max(compressed_bytes, 1),
+                'compress_mib_s': sample_bytes / max(compress_time, 0.001) / (1024 * 1024),
+                'decompress_mib_s': sample_bytes / max(decompress_time, 0.001) / (1024 * 1024)
+            })
+
+        logging.info("Codec benchmark results (sample=%i bytes, threads=%i)",
+                     sample_bytes, Codec.get_configured_threads())
+        logging.info("%-6s %8s %16s %18s", "codec", "ratio", "compress MiB/s", "decompress MiB/s")
+
+        for result in results:
+            logging.info("%-6s %8.2f %16.2f %18.2f", result['codec'], result['ratio'],
+                         result['compress_mib_s'], result['decompress_mib_s'])
+
+        return results
+
+    @staticmethod
+    def read_directory_sample(directory, sample_size):
+        """
+        Read the first sample_size bytes of a tar stream of the directory
+        """
+        tar = ["/bin/tar", "cf", "-", "-C", directory, "."]
+        tar_process = subprocess.Popen(tar, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        sample = []
+        read_bytes = 0
+
+        while read_bytes < sample_size:
+            chunk = tar_process.stdout.read(min(Benchmark.chunk_size, sample_size - read_bytes))
+
+            if not chunk:
+                break
+
+            sample.append(chunk)
+            read_bytes = read_bytes + len(chunk)
+
+        tar_process.kill()
+        tar_process.wait()
+
+        return sample
+
+    @staticmethod
+    def measure_command(command, chunks):
+        """
+        Feed the chunks into the command. Return the output of
+        the command and the elapsed time.
+        """
+        output = []
+
+        def read_output(stream):
+            while True:
+                chunk = stream.read(Benchmark.chunk_size)
+
+                if not chunk:
+                    break
+
+                output.append(chunk)
+
+        start_time = time.time()
+
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        reader_thread = threading.Thread(target=read_output, args=(process.stdout,))
+        reader_thread.start()
+
+        for chunk in chunks:
+            process.stdin.write(chunk)
+
+        process.stdin.close()
+        reader_thread.join()
+        process.wait()
+
+        return (output, time.time() - start_time)
+
+    @staticmethod
+    def run_replication_benchmark(transactions):
+        """
+        Measure the apply throughput of this replication follower with
+        one applier thread and with the configured number of applier
+        threads. For each run, the SQL thread is stopped, write load is
+        generated on the leader and the time to apply the relay log is
+        measured. Log and return the transactions per second.
+        """
+        leader_ip = Mysql.get_replication_leader_ip()
+
+        if leader_ip is None:
+            logging.error("The replication benchmark has to be executed on a follower")
+            return []
+
+        configured_workers = Mysql.get_replication_workers()
+        results = []
+
+        try:
+            for workers in sorted({1, configured_workers}):
+                logging.info("Benchmarking replication apply with %i workers", workers)
+                Mysql.execute_query_as_root("STOP SLAVE SQL_THREAD", discard_result=True)
+                Mysql.execute_query_as_root(f"SET GLOBAL slave_parallel_workers = {workers}",
+                                            discard_result=True)
+
+                target_gtid_set = Benchmark.generate_leader_load(leader_ip, transactions)
+                Benchmark.wait_for_retrieved_gtid_set(target_gtid_set)
+
+                start_time = time.time()
+                Mysql.execute_query_as_root("START SLAVE SQL_THREAD", discard_result=True)
+                Mysql.execute_query_as_root(f"SELECT WAIT_FOR_EXECUTED_GTID_SET('{target_gtid_set}')",
+                                            discard_result=True)
+                duration = time.time() - start_time
+
+                results.append({'workers': workers, 'transactions': transactions,
+                                'tps': transactions / max(duration, 0.001)})
+        finally:
+            Mysql.execute_query_as_root("STOP SLAVE SQL_THREAD", discard_result=True)
+            Mysql.execute_query_as_root(f"SET GLOBAL slave_parallel_workers = {configured_workers}",
+                                        discard_result=True)
+            Mysql.execute_query_as_root("START SLAVE SQL_THREAD", discard_result=True)
+            Benchmark.execute_on_leader(leader_ip, [f"DROP DATABASE IF EXISTS {Benchmark.benchmark_database}"])
+
+        logging.info("Replication benchmark results (transactions=%i, writer threads=%i)",
+                     transactions, Benchmark.writer_threads)
+        logging.info("%-8s %12s", "workers", "apply tps")
+
+        for result in results:
+            logging.info("%-8i %12.1f", result['workers'], result['tps'])
+
+        return results
+
+    @staticmethod
+    def execute_on_leader(leader_ip, statements):
+        """
+        Execute the statements on the replication leader and return
+        the result of the last statement
+        """
+        cnx = mysql.connector.connect(host=leader_ip, port=3306, user='root',
+                                      password=os.environ.get("MYSQL_ROOT_PASSWORD"),
+                                      autocommit=True)
+
+        try:
+            cursor = cnx.cursor()
+
+            for statement in statements:
+                cursor.execute(statement)
+
+            return cursor.fetchall() if cursor.with_rows else None
+        finally:
+            cnx.close()
+
+    @staticmethod
+    def generate_leader_load(leader_ip, transactions):
+        """
+        Execute the transactions (single row inserts) with concurrent
+        clients on the leader. Returns the gtid_executed of the leader.
+        """
+        table = f"{Benchmark.benchmark_database}.apply_benchmark"
+        Benchmark.execute_on_leader(leader_ip, [
+            f"CREATE DATABASE IF NOT EXISTS {Benchmark.benchmark_database}",
+            f"CREATE TABLE IF NOT EXISTS {table} (id BIGINT AUTO_INCREMENT PRIMARY KEY, "
+            "writer INT NOT NULL, payload VARCHAR(255) NOT NULL)"])
+
+        def write_transactions(writer, count):
+            Benchmark.execute_on_leader(leader_ip, [
+                f"INSERT INTO {table} (writer, payload) VALUES ({writer}, REPEAT('x', 200))"
+            ] * count)
+
+        threads = []
+
+        for writer in range(Benchmark.writer_threads):
+            count = transactions // Benchmark.writer_threads
+            if writer < transactions % Benchmark.writer_threads:
+                count = count + 1
+
+            thread = threading.Thread(target=write_transactions, args=(writer, count))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        result = Benchmark.execute_on_leader(leader_ip, ["SELECT @@GLOBAL.gtid_executed"])
+        return result[0][0].replace("\n", "")
+
+    @staticmethod
+    def wait_for_retrieved_gtid_set(gtid_set, timeout=600):
+        """
+        Wait until the IO thread has retrieved all transactions of the GTID set
+        """
+        for _ in range(timeout):
+            slave_status = Mysql.execute_query_as_root("SHOW SLAVE STATUS")
+            retrieved = slave_status[0]['Retrieved_Gtid_Set'].replace("\n", "")
+            executed = Mysql.execute_query_as_root("SELECT @@GLOBAL.gtid_executed")[0]['@@GLOBAL.gtid_executed']
+
+            available = ",".join(gtid for gtid in (retrieved, executed.replace("\n", "")) if gtid)
+
+            if Mysql.is_gtid_subset(gtid_set, available):
+                return True
+
+            time.sleep(1)
+
+        logging.error("Transactions of the leader not retrieved after %i seconds", timeout)
+        return False
@@ -0,0 +1,356 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import subprocess
+
+from datetime import datetime, timezone
+
+from mcm.cache import BackupCache
+from mcm.catalog import BackupCatalog
+from mcm.codec import Codec
+from mcm.consul import Consul
+from mcm.gtid import Gtid
+from mcm.minio import Minio
+from mcm.mysql import Mysql
+from mcm.utils import MeteredStream
+
+class BinlogArchive:
+    """
+    Archive the closed binlog files of the replication leader in the
+    S3 bucket. The GTID set of each file is stored in the binlog index
+    in Consul, so the files needed for a point-in-time recovery (base
+    backup + binlogs up to a timestamp or a GTID set) can be selected
+    without listing the bucket.
+    """
+
+    mysql_binlog_binary = "/usr/bin/mysqlbinlog"
+    mysql_client_binary = "/usr/bin/mysql"
+
+    def __init__(self):
+        """
+        Init the archive
+        """
+        # The open binlog file and the time it was seen first
+        self.current_file = None
+        self.current_file_seen = None
+        self.current_file_size = None
+
+    @staticmethod
+    def get_max_age():
+        """
+        Get the time after that the open binlog file is closed (if it
+        contains new transactions), so it can be archived
+        """
+        return int(os.getenv('MCM_BINLOG_MAX_AGE', "300"))
+
+    @staticmethod
+    def get_object_name(record):
+        """
+        Get the object of the archived binlog file
+        """
+        codec = Codec.get_codec(record['codec'])
+        return f"binlogs/{record['server_uuid']}/{record['file']}.{codec.extension}"
+
+    @staticmethod
+    def get_previous_gtids(binlog_file):
+        """
+        Get the GTID set that was executed before the binlog file was opened
+        """
+        events = Mysql.execute_query_as_root(f"SHOW BINLOG EVENTS IN '{binlog_file}' LIMIT 3")
+
+        for event in events:
+            if event['Event_type'] == "Previous_gtids":
+                return event['Info'].replace("\n", "")
+
+        return ""
+
+    def rotate_if_needed(self, binlogs):
+        """
+        Close the open binlog file, if it contains transactions and is older
+        than MCM_BINLOG_MAX_AGE. Returns True if the file was closed.
+        """
+        current_binlog = binlogs[-1]
+
+        if current_binlog['Log_name'] != self.current_file:
+            self.current_file = current_binlog['Log_name']
+            self.current_file_seen = time.time()
+            self.current_file_size = current_binlog['File_size']
+            return False
+
+        if current_binlog['File_size'] <= self.current_file_size:
+            return False
+
+        if time.time() - self.current_file_seen < BinlogArchive.get_max_age():
+            return False
+
+        logging.debug("Closing binlog file %s for archiving", self.current_file)
+        Mysql.execute_query_as_root("FLUSH BINARY LOGS", discard_result=True)
+        return True
+
+    def archive_if_needed(self):
+        """
+        Archive the closed binlog files of the replication leader that
+        are newer than the oldest backup
+        """
+        consul = Consul.get_instance()
+
+        if not consul.is_replication_leader():
+            return False
+
+        backup_records = consul.get_backup_records()
+
+        # Binlogs are only useful on top of a backup
+        if not backup_records:
+            return False
+
+        oldest_backup = min(record['timestamp'] for record in backup_records)
+        binlog_records = consul.get_binlog_records()
+
+        binlogs = Mysql.execute_query_as_root("SHOW BINARY LOGS")
+
+        if not binlogs:
+            return False
+
+        if self.rotate_if_needed(binlogs):
+            binlogs = Mysql.execute_query_as_root("SHOW BINARY LOGS")
+
+        server_uuid = Mysql.execute_query_as_root("SELECT @@GLOBAL.server_uuid")[0]['@@GLOBAL.server_uuid']
+        binlog_dir = os.path.dirname(Mysql.execute_query_as_root(
+            "SELECT @@GLOBAL.log_bin_basename")[0]['@@GLOBAL.log_bin_basename'])
+
+        archived_files = {record['file'] for record in binlog_records
+                          if record['server_uuid'] == server_uuid}
+
+        # The last file is still open
+        for binlog, next_binlog in zip(binlogs, binlogs[1:]):
+            filename = f"{binlog_dir}/{binlog['Log_name']}"
+
+            if binlog['Log_name'] in archived_files or not os.path.isfile(filename):
+                continue
+
+            if os.path.getmtime(filename) < oldest_backup:
+                continue
+
+            previous_gtids = BinlogArchive.get_previous_gtids(binlog['Log_name'])
+            next_previous_gtids = BinlogArchive.get_previous_gtids(next_binlog['Log_name'])
+            gtid_set = Mysql.execute_query_as_root(
+                f"SELECT GTID_SUBTRACT('{next_previous_gtids}', '{previous_gtids}') AS gtid_set")[0]['gtid_set']
+
+            record = {
+                'file': binlog['Log_name'],
+                'server_uuid': server_uuid,
+                'gtid_set': gtid_set.replace("\n", ""),
+                'previous_gtids': previous_gtids,
+                'end_time': os.path.getmtime(filename)
+            }
+
+            if not BinlogArchive.upload_binlog(filename, record):
+                return False
+
+        return True
+
+    @staticmethod
+    def upload_binlog(filename, record):
+        """
+        Compress the binlog file, upload it into the bucket and add
+        it to the binlog index
+        """
+        codec = Codec.get_configured_codec()
+        record['codec'] = codec.name
+        object_name = BinlogArchive.get_object_name(record)
+
+        logging.info("Archiving binlog file %s as %s (gtid_set=%s)",
+                     filename, object_name, record['gtid_set'])
+
+        compress = codec.get_compress_command(level=Codec.get_configured_level(),
+                                              threads=Codec.get_configured_threads())
+
+        with open(filename, "rb") as binlog_file:
+            compress_process = subprocess.Popen(compress, stdin=binlog_file, stdout=subprocess.PIPE)
+
+        checksum = hashlib.sha256()
+        binlog_stream = MeteredStream(compress_process.stdout, checksum)
+        upload_result = Minio.upload_stream(object_name, binlog_stream, {"mcm-codec": codec.name},
+                                            os.path.getsize(filename))
+
+        if not upload_result:
+            compress_process.kill()
+
+        compress_process.stdout.close()
+
+        if compress_process.wait() or not upload_result:
+            logging.error("Unable to archive binlog file %s, upload=%s", filename, upload_result)
+            Minio.remove_object(object_name)
+            return False
+
+        record['size'] = binlog_stream.read_bytes
+        record['checksum'] = f"sha256:{checksum.hexdigest()}"
+
+        return Consul.get_instance().add_binlog_to_index(record)
+
+    @staticmethod
+    def get_base_backup(until_time=None, until_gtid=None):
+        """
+        Get the latest backup that was created before the given time
+        and contains only transactions of the given GTID set
+        """
+        candidates = []
+        records = Consul.get_instance().get_backup_records()
+
+        for record in records:
+            # Backups without a GTID position can not be rolled forward
+            if 'gtid_executed' not in record or not BackupCatalog.is_restorable(record, records):
+                continue
+
+            if until_time is not None and record['timestamp'] > until_time:
+                continue
+
+            if until_gtid is not None and not Gtid.is_subset(record['gtid_executed'], until_gtid):
+                continue
+
+            candidates.append(record)
+
+        return max(candidates, key=lambda record: record['timestamp'], default=None)
+
+    @staticmethod
+    def get_binlogs_to_replay(gtid_executed, until_time=None):
+        """
+        Get the records of the archived binlog files that contain
+        transactions not executed yet, in the order of their creation
+        """
+        binlog_records = sorted(Consul.get_instance().get_binlog_records(),
+                                key=lambda record: record['end_time'])
+        covered_gtids = gtid_executed
+        result = []
+
+        for record in binlog_records:
+            # The files of a former leader are also contained in the
+            # binlogs of the current leader
+            if Gtid.is_subset(record['gtid_set'], covered_gtids):
+                continue
+
+            result.append(record)
+            covered_gtids = f"{covered_gtids},{record['gtid_set']}"
+
+            # The file contains the target time
+            if until_time is not None and record['end_time'] >= until_time:
+                break
+
+        return result
+
+    @staticmethod
+    def download_binlog(record, target_dir):
+        """
+        Download and decompress the archived binlog file into the
+        directory. Returns the name of the file (None on error).
+        """
+        object_name = BinlogArchive.get_object_name(record)
+        compressed_file = f"{target_dir}/{os.path.basename(object_name)}"
+        filename = f"{target_dir}/{record['server_uuid']}_{record['file']}"
+
+        logging.info("Downloading binlog file %s", object_name)
+
+        with open(compressed_file, "wb") as outfile:
+            if not Minio.download_stream(object_name, outfile):
+                return None
+
+        if BackupCache.get_checksum(compressed_file) != record['checksum']:
+            logging.error("Checksum of binlog file %s does not match", object_name)
+            return None
+
+        codec = Codec.get_codec(record['codec'])
+
+        with open(compressed_file, "rb") as infile, open(filename, "wb") as outfile:
+            result = subprocess.run(codec.get_decompress_command(), stdin=infile,
+                                    stdout=outfile, check=False)
+
+        os.remove(compressed_file)
+
+        if result.returncode != 0:
+            logging.error("Unable to decompress binlog file %s", object_name)
+            return None
+
+        return filename
+
+    @staticmethod
+    def restore_to(until_time=None, until_gtid=None):
+        """
+        Restore the latest backup before the target and replay the
+        archived binlogs up to the given time (UTC timestamp) or until
+        all transactions of the given GTID set are applied
+        """
+        base_backup = BinlogArchive.get_base_backup(until_time, until_gtid)
+
+        if base_backup is None:
+            logging.error("No backup found for the point-in-time recovery")
+            return False
+
+        logging.info("Point-in-time recovery based on backup %s (until_time=%s, until_gtid=%s)",
+                     base_backup['name'], until_time, until_gtid)
+
+        if not Mysql.restore_backup(base_backup):
+            return False
+
+        # The replication must not apply transactions of the leader
+        mysql_process = Mysql.server_start(exit_on_error=False, options=["--skip-slave-start"])
+
+        if mysql_process is None:
+            return False
+
+        try:
+            gtid_executed = Mysql.execute_query_as_root(
+                "SELECT @@GLOBAL.gtid_executed")[0]['@@GLOBAL.gtid_executed']
+            binlog_records = BinlogArchive.get_binlogs_to_replay(gtid_executed, until_time)
+
+            with tempfile.TemporaryDirectory() as binlog_dir:
+                binlog_files = [BinlogArchive.download_binlog(record, binlog_dir)
+                                for record in binlog_records]
+
+                if None in binlog_files:
+                    return False
+
+                return BinlogArchive.replay_binlogs(binlog_files, until_time, until_gtid)
+        finally:
+            Mysql.server_stop()
+            mysql_process.wait()
+
+    @staticmethod
+    def replay_binlogs(binlog_files, until_time=None, until_gtid=None):
+        """
+        Apply the binlog files to the running server. Transactions that
+        are already executed are skipped by the server (GTID auto-skip).
+        """
+        logging.info("Replaying %i binlog files", len(binlog_files))
+
+        mysqlbinlog = [BinlogArchive.mysql_binlog_binary]
+
+        if until_time is not None:
+            stop_datetime = datetime.fromtimestamp(until_time, timezone.utc)
+            mysqlbinlog.append(f"--stop-datetime={stop_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        if until_gtid is not None:
+            mysqlbinlog.append(f"--include-gtids={until_gtid}")
+
+        # mysqlbinlog interprets the stop time in the local time zone
+        binlog_env = {**os.environ, "TZ": "UTC"}
+        client_env = {**os.environ, "MYSQL_PWD": os.environ.get("MYSQL_ROOT_PASSWORD", "")}
+
+        binlog_process = subprocess.Popen(mysqlbinlog + binlog_files, env=binlog_env,
+                                          stdout=subprocess.PIPE)
+        client_process = subprocess.Popen([BinlogArchive.mysql_client_binary, "-uroot"],
+                                          env=client_env, stdin=binlog_process.stdout)
+        binlog_process.stdout.close()
+
+        return_codes = [binlog_process.wait(), client_process.wait()]
+
+        if any(return_codes):
+            logging.error("Unable to replay the binlogs, return codes (mysqlbinlog, mysql) are %s",
+                          return_codes)
+            return False
+
+        logging.info("Point-in-time recovery done")
+        return True
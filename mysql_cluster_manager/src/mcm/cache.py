@@ -0,0 +1,177 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import hashlib
+import logging
+
+
+class BackupCache:
+    """
+    A local cache of downloaded backup objects. Objects are keyed by
+    name and checksum (sha256 of the object). The least recently used
+    objects are evicted when the size limit is reached.
+    """
+
+    @staticmethod
+    def get_directory():
+        """
+        Get the cache directory
+        """
+        return os.getenv('MCM_BACKUP_CACHE_DIR', "/var/lib/mysql_backup_cache")
+
+    @staticmethod
+    def get_max_size():
+        """
+        Get the size limit of the cache in bytes (0 disables the cache)
+        """
+        return int(os.getenv('MCM_BACKUP_CACHE_SIZE', str(10 * 1024 * 1024 * 1024)))
+
+    @staticmethod
+    def get_path(backup_record):
+        """
+        Get the cache file of the backup
+        """
+        return f"{BackupCache.get_directory()}/{backup_record['name']}"
+
+    @staticmethod
+    def get_checksum(filename):
+        """
+        Get the checksum of the file
+        """
+        checksum = hashlib.sha256()
+
+        with open(filename, "rb") as infile:
+            for chunk in iter(lambda: infile.read(1024 * 1024), b""):
+                checksum.update(chunk)
+
+        return f"sha256:{checksum.hexdigest()}"
+
+    @staticmethod
+    def get_cached_file(backup_record):
+        """
+        Get the cache file of the backup, if the backup is cached and the
+        content matches the checksum of the backup. None otherwise.
+        """
+        filename = BackupCache.get_path(backup_record)
+
+        if 'checksum' not in backup_record or not os.path.isfile(filename):
+            return None
+
+        if BackupCache.get_checksum(filename) != backup_record['checksum']:
+            logging.warning("Cached backup %s is corrupted, removing", backup_record['name'])
+            os.remove(filename)
+            return None
+
+        # Mark the object as recently used
+        os.utime(filename)
+        return filename
+
+    @staticmethod
+    def get_writer(backup_record, stream):
+        """
+        Get a stream that writes the data into the given stream and into
+        the cache. The data is written directly into the stream, if the
+        backup has no checksum. Backups that can not be cached are only
+        verified against the checksum.
+        """
+        max_size = BackupCache.get_max_size()
+
+        if 'checksum' not in backup_record:
+            return stream
+
+        if max_size <= 0 or backup_record.get('size', 0) > max_size:
+            return CacheWriter(backup_record, stream, cache=False)
+
+        try:
+            os.makedirs(BackupCache.get_directory(), exist_ok=True)
+            BackupCache.evict(max_size - backup_record.get('size', 0))
+            return CacheWriter(backup_record, stream)
+        except OSError as error:
+            logging.warning("Unable to cache backup %s: %s", backup_record['name'], error)
+            return CacheWriter(backup_record, stream, cache=False)
+
+    @staticmethod
+    def evict(max_size):
+        """
+        Remove the least recently used objects until the cache
+        is smaller than the given size
+        """
+        directory = BackupCache.get_directory()
+        entries = []
+
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+
+        cache_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if cache_size <= max_size:
+                break
+
+            logging.info("Evicting %s from the backup cache", path)
+            os.remove(path)
+            cache_size = cache_size - size
+
+
+class CacheWriter:
+    """
+    A writable stream that forwards the data to another stream and
+    writes it into the cache. The content is verified against the
+    checksum of the backup by finish(), also if the backup is not
+    cached. Errors of the cache file (e.g., a full disk) disable the
+    caching but not the download.
+    """
+
+    def __init__(self, backup_record, stream, cache=True):
+        """
+        Init the writer (without cache, the content is only verified)
+        """
+        self.backup_record = backup_record
+        self.stream = stream
+        self.checksum = hashlib.sha256()
+        self.filename = BackupCache.get_path(backup_record)
+        self.cache = cache
+        self.cache_file = open(f"{self.filename}.partial", "wb") if cache else None
+
+    def write(self, data):
+        """
+        Write the data into the stream and the cache file
+        """
+        self.stream.write(data)
+        self.checksum.update(data)
+
+        if self.cache_file is not None:
+            try:
+                self.cache_file.write(data)
+            except OSError as error:
+                logging.warning("Unable to cache backup %s: %s", self.backup_record['name'], error)
+                self.cache_file = None
+
+        return len(data)
+
+    def finish(self, success):
+        """
+        Verify the downloaded content and publish the cache file. Returns
+        False if the download failed or the checksum does not match.
+        """
+        checksum = f"sha256:{self.checksum.hexdigest()}"
+        verified = success and checksum == self.backup_record['checksum']
+
+        if success and not verified:
+            logging.error("Checksum of backup %s does not match (expected %s, got %s)",
+                          self.backup_record['name'], self.backup_record['checksum'], checksum)
+
+        try:
+            if self.cache_file is not None:
+                self.cache_file.close()
+
+                if verified:
+                    os.replace(f"{self.filename}.partial", self.filename)
+
+            if self.cache and os.path.exists(f"{self.filename}.partial"):
+                os.remove(f"{self.filename}.partial")
+        except OSError as error:
+            logging.warning("Unable to cache backup %s: %s", self.backup_record['name'], error)
+
+        return verified
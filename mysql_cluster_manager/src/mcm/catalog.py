@@ -0,0 +1,187 @@
+"""This file is part of the MySQL cluster manager"""
+
+import time
+import logging
+
+from mcm.codec import Codec
+from mcm.consul import Consul
+from mcm.minio import Minio
+
+
+class BackupCatalog:
+    """
+    The catalog of the available backups. The catalog is stored in
+    the Consul KV store, so the latest backup can be determined without
+    listing the bucket. The chain records next to the backups in the
+    bucket are used to rebuild the catalog.
+    """
+
+    @staticmethod
+    def add_backup(record):
+        """
+        Add a finished backup to the catalog (expired backups are
+        removed by the retention policy)
+        """
+        return Consul.get_instance().add_backup_to_catalog(record)
+
+    @staticmethod
+    def get_latest_backup():
+        """
+        Get the record of the latest backup (None if no backup exists)
+        """
+        record = Consul.get_instance().get_latest_backup_record()
+
+        if record is None:
+            record = BackupCatalog.rebuild_from_bucket()
+
+        return record
+
+    @staticmethod
+    def get_restore_backup():
+        """
+        Get the record of the backup that should be restored: the latest
+        verified backup or, if no backup is verified, the latest backup.
+        Backups that are based on a corrupt backup are skipped.
+        """
+        records = Consul.get_instance().get_backup_records()
+
+        if not records:
+            return BackupCatalog.get_latest_backup()
+
+        restorable = [record for record in records
+                      if BackupCatalog.is_restorable(record, records)]
+        verified = [record for record in restorable
+                    if BackupCatalog.get_verification_status(record) == "verified"]
+
+        if not restorable:
+            logging.error("All backups of the catalog are corrupt")
+            return None
+
+        return max(verified or restorable, key=lambda record: record['timestamp'])
+
+    @staticmethod
+    def get_verification_status(record):
+        """
+        Get the result of the verification of the backup (verified or
+        corrupt, None if not verified)
+        """
+        return record.get('verification', {}).get('status')
+
+    @staticmethod
+    def is_restorable(record, records):
+        """
+        Is the backup and every backup it is based on not known to be corrupt
+        """
+        records_by_name = {entry['name']: entry for entry in records}
+
+        while record is not None:
+            if BackupCatalog.get_verification_status(record) == "corrupt":
+                return False
+
+            record = records_by_name.get(record.get('parent'))
+
+        return True
+
+    @staticmethod
+    def record_verification(record, status, duration):
+        """
+        Store the result of the verification in the catalog and
+        in the chain record of the backup. Backups removed from the
+        catalog in the meantime (e.g., by the retention) are not restored.
+        """
+        record['verification'] = {
+            'status': status,
+            'duration': duration,
+            'timestamp': time.time()
+        }
+
+        consul = Consul.get_instance()
+
+        if not consul.update_backup_in_catalog(record):
+            return False
+
+        Minio.write_chain_record(record)
+
+        # The backup was removed while the chain record was written
+        if consul.get_backup_record(record['name']) is None:
+            Minio.remove_object(f"{record['name']}.json")
+            return False
+
+        return True
+
+    @staticmethod
+    def get_backup(backup_name):
+        """
+        Get the record of the given backup
+        """
+        record = Consul.get_instance().get_backup_record(backup_name)
+
+        if record is None:
+            record = Minio.read_chain_record(backup_name)
+
+        return record
+
+    @staticmethod
+    def does_backup_exists():
+        """
+        Does a backup exist?
+        """
+        return BackupCatalog.get_latest_backup() is not None
+
+    @staticmethod
+    def rebuild_from_bucket():
+        """
+        Rebuild the catalog from the objects of the bucket and return
+        the record of the latest backup. Only needed when the catalog
+        is empty (e.g., a new Consul cluster or backups of an older version).
+        """
+        backups = Minio.get_backups()
+
+        if not backups:
+            logging.debug("S3 Bucket is empty, no catalog to rebuild")
+            return None
+
+        logging.info("Rebuilding backup catalog from %i backups in bucket", len(backups))
+
+        records = []
+
+        for backup_name, backup_date in backups:
+            record = Minio.read_chain_record(backup_name)
+
+            # Backup created before chain records were introduced
+            if record is None:
+                if "_incremental." in backup_name:
+                    continue
+
+                record = {
+                    'name': backup_name,
+                    'type': 'full',
+                    'base': backup_name,
+                    'parent': None,
+                    'chain_position': 0,
+                    'codec': Codec.get_codec_for_object(backup_name).name,
+                    'timestamp': backup_date.timestamp()
+                }
+
+            BackupCatalog.add_backup(record)
+            records.append(record)
+
+        if not records:
+            return None
+
+        return max(records, key=lambda record: record['timestamp'])
+
+    @staticmethod
+    def wait_for_backup_exists(retry_counter=100):
+        """
+        Wait for a backup to occur
+        """
+        for _ in range(retry_counter):
+            if BackupCatalog.does_backup_exists():
+                return True
+
+            # Keep consul sessions alive
+            Consul.get_instance().refresh_sessions()
+            time.sleep(5)
+
+        return False
@@ -0,0 +1,138 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import logging
+
+from mcm.resources import Resources
+
+
+class Codec:
+    """
+    This class encapsulates the compression codecs of the backups
+    """
+
+    # The available codecs
+    __codecs = {}
+
+    def __init__(self, name, extension, binary, levels, threads_option=None,
+                 extra_options=()):
+        """
+        Init the codec
+        """
+        self.name = name
+        self.extension = extension
+        self.binary = binary
+        self.default_level, self.max_level = levels
+        self.threads_option = threads_option
+        self.extra_options = list(extra_options)
+
+    def is_available(self):
+        """
+        Is the binary of the codec installed
+        """
+        return os.access(self.binary, os.X_OK)
+
+    def get_compress_command(self, level=None, threads=None):
+        """
+        Get the command to compress stdin to stdout
+        """
+        if level is None:
+            level = self.default_level
+
+        level = max(1, min(level, self.max_level))
+
+        command = [self.binary, "-c", f"-{level}"] + self.extra_options
+
+        # Multi-threaded compression
+        if self.threads_option is not None:
+            command.append(self.threads_option.format(threads or Resources.get_cpus()))
+
+        return command
+
+    def get_decompress_command(self):
+        """
+        Get the command to decompress stdin to stdout
+        """
+        return [self.binary, "-dc"] + self.extra_options
+
+    @staticmethod
+    def register_codec(codec):
+        """
+        Register a new codec
+        """
+        Codec.__codecs[codec.name] = codec
+
+    @staticmethod
+    def get_codecs():
+        """
+        Get all registered codecs
+        """
+        return list(Codec.__codecs.values())
+
+    @staticmethod
+    def get_codec(name):
+        """
+        Get the codec with the given name
+        """
+        if name not in Codec.__codecs:
+            raise ValueError(f"Unknown compression codec {name}")
+
+        return Codec.__codecs[name]
+
+    @staticmethod
+    def get_codec_for_object(object_name, metadata=None):
+        """
+        Get the codec of a backup object. The codec stored in the
+        object metadata is preferred, the file extension is the fallback.
+        """
+        if metadata and metadata.get("mcm-codec") in Codec.__codecs:
+            return Codec.get_codec(metadata["mcm-codec"])
+
+        for codec in Codec.__codecs.values():
+            if object_name.endswith(f".{codec.extension}"):
+                return codec
+
+        # Legacy backups (.tgz) are compressed with gzip
+        return Codec.get_codec("pigz")
+
+    @staticmethod
+    def get_configured_codec():
+        """
+        Get the codec that is configured for new backups
+        """
+        codec = Codec.get_codec(os.getenv('MCM_BACKUP_CODEC', "zstd"))
+
+        if not codec.is_available():
+            logging.warning("Binary %s of codec %s not found, using pigz",
+                            codec.binary, codec.name)
+            codec = Codec.get_codec("pigz")
+
+        return codec
+
+    @staticmethod
+    def get_configured_level():
+        """
+        Get the configured compression level (None = codec default)
+        """
+        level = os.getenv('MCM_BACKUP_COMPRESSION_LEVEL')
+
+        if level is None:
+            return None
+
+        return int(level)
+
+    @staticmethod
+    def get_configured_threads():
+        """
+        Get the configured number of compression threads
+        """
+        return int(os.getenv('MCM_BACKUP_COMPRESSION_THREADS', str(Resources.get_cpus())))
+
+
+# The lz4 binary of Debian Buster does not support multiple threads
+Codec.register_codec(Codec("zstd", "zst", "/usr/bin/zstd", levels=(3, 19),
+                           threads_option="-T{}", extra_options=["-q"]))
+Codec.register_codec(Codec("lz4", "lz4", "/usr/bin/lz4", levels=(1, 12),
+                           extra_options=["-q"]))
+Codec.register_codec(Codec("pigz", "gz", "/usr/bin/pigz", levels=(6, 9),
+                           threads_option="--processes={}"))
@@ -0,0 +1,173 @@
+"""This file is part of the MySQL cluster manager"""
+
+import logging
+import threading
+
+import mysql.connector
+
+class ConnectionPool:
+    """
+    A small pool of connections to the local MySQL server or the
+    ProxySQL admin interface. Connections are reused across calls and
+    re-established transparently when the server has closed them.
+    """
+
+    # The pools of the process (one per connection parameter set)
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def __init__(self, connection_args, max_idle=2):
+        """
+        Init the pool
+        """
+        self.connection_args = connection_args
+        self.max_idle = max_idle
+        self.idle_connections = []
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.connects = 0
+        self.reconnects = 0
+        self.queries = 0
+
+    @staticmethod
+    def get_pool(username='root', password=None, database='mysql', port=None):
+        """
+        Get the pool for the given connection parameters. Without
+        a port, the unix socket of the local MySQL server is used.
+        """
+        key = (username, password, database, port)
+
+        with ConnectionPool.pools_lock:
+            if key not in ConnectionPool.pools:
+                connection_args = {'user': username, 'password': password,
+                                   'database': database, 'autocommit': True}
+
+                if port is None:
+                    connection_args['unix_socket'] = '/var/run/mysqld/mysqld.sock'
+                else:
+                    connection_args['port'] = port
+
+                ConnectionPool.pools[key] = ConnectionPool(connection_args)
+
+            return ConnectionPool.pools[key]
+
+    @staticmethod
+    def get_statistics():
+        """
+        Get the connect and query counters of all pools
+        """
+        with ConnectionPool.pools_lock:
+            pools = list(ConnectionPool.pools.values())
+
+        return [{'user': pool.connection_args['user'],
+                 'port': pool.connection_args.get('port'),
+                 'connects': pool.connects,
+                 'reconnects': pool.reconnects,
+                 'queries': pool.queries} for pool in pools]
+
+    @staticmethod
+    def close_all():
+        """
+        Close the idle connections of all pools
+        """
+        with ConnectionPool.pools_lock:
+            pools = list(ConnectionPool.pools.values())
+
+        for pool in pools:
+            pool.close()
+
+    def acquire(self):
+        """
+        Get an idle connection or establish a new one. The second
+        return value indicates whether the connection was reused.
+        """
+        with self.lock:
+            if self.idle_connections:
+                return (self.idle_connections.pop(), True)
+
+            self.connects = self.connects + 1
+
+        return (mysql.connector.connect(**self.connection_args), False)
+
+    def release(self, cnx):
+        """
+        Return the connection to the pool
+        """
+        with self.lock:
+            if len(self.idle_connections) < self.max_idle:
+                self.idle_connections.append(cnx)
+                return
+
+        cnx.close()
+
+    def discard(self, cnx):
+        """
+        Close a broken connection without returning it to the pool
+        """
+        try:
+            cnx.close()
+        except mysql.connector.Error:
+            pass
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            idle_connections = self.idle_connections
+            self.idle_connections = []
+
+        for cnx in idle_connections:
+            self.discard(cnx)
+
+    def execute(self, sql, fetch_result=False):
+        """
+        Execute the SQL statement and return the result rows (as dicts)
+        if requested. A reused connection that was closed by the server is
+        replaced by a new connection and the statement is executed again.
+        """
+        return self.execute_statements([sql], fetch_result=fetch_result)
+
+    def execute_statements(self, statements, fetch_result=False):
+        """
+        Execute the SQL statements in one session and return the result
+        rows of the last statement if requested. The statements are only
+        executed again on a new connection if the connection was lost
+        before the first statement was executed.
+        """
+        cnx, reused = self.acquire()
+        executed = 0
+
+        while True:
+            try:
+                cur = cnx.cursor(dictionary=True, buffered=True)
+
+                for sql in statements:
+                    cur.execute(sql)
+                    executed = executed + 1
+
+                result = cur.fetchall() if fetch_result else None
+                cur.close()
+                break
+            except mysql.connector.Error as err:
+                # Errors of the statements itself are not retried
+                connection_lost = reused and executed == 0 and not cnx.is_connected()
+                self.discard(cnx)
+
+                if not connection_lost:
+                    raise
+
+                logging.debug("Pooled connection was closed (%s), reconnecting", err)
+
+                with self.lock:
+                    self.reconnects = self.reconnects + 1
+
+                cnx, reused = self.acquire()
+
+        with self.lock:
+            self.queries = self.queries + len(statements)
+
+        self.release(cnx)
+
+        return result
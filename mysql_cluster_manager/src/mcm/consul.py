@@ -3,12 +3,15 @@
 import os
 import time
 import json
+import base64
 import logging
 import threading
 import subprocess
 
+import requests
 import consul as pyconsul
 
+from mcm.metrics import Metrics
 from mcm.utils import Utils
 
 class Consul:
@@ -38,6 +41,24 @@ class Consul:
     # Replication leader path
     replication_leader_path = kv_prefix + "replication_leader"
 
+    # Backup catalog path
+    backup_catalog_path = kv_prefix + "backups/"
+
+    # Latest backup key
+    latest_backup_key = kv_prefix + "latest_backup"
+
+    # Archived binlogs path (GTID index)
+    binlog_index_path = kv_prefix + "binlogs/"
+
+    # MySQL option overrides path
+    mysql_config_path = kv_prefix + "mysql_config/"
+
+    # Backup lock key (held by the node that creates a backup)
+    backup_lock_key = kv_prefix + "backup_lock"
+
+    # Verification lock key (held by the node that verifies a backup)
+    verification_lock_key = kv_prefix + "verification_lock"
+
     def __init__(self):
         """
         Init the Consul client
@@ -51,6 +72,9 @@ class Consul:
         self.active_sessions = []
         self.node_health_session = self.create_node_health_session()
 
+        # The record of this node in the instances path
+        self.node_record = None
+
         # The session auto refresh thread
         self.auto_refresh_thread = None
         self.run_auto_refresh_thread = False
@@ -106,11 +130,23 @@ class Consul:
         """
         Get all registered MySQL nodes
         """
-        mysql_nodes = []
+        return [node_data["ip_address"] for node_data in self.get_all_registered_node_records()]
+
+    @Metrics.time_consul_operation
+    def get_all_registered_node_records(self, locked_only=False):
+        """
+        Get the records (ip address, server id, replication status)
+        of all registered MySQL nodes. With locked_only, only the records
+        held by the health session of a running node are returned.
+        """
+        node_records = []
         result = self.client.kv.get(Consul.instances_path, recurse=True)
 
         if result[1] is not None:
             for node in result[1]:
+                if locked_only and node.get('Session') is None:
+                    continue
+
                 node_value = node['Value']
                 node_data = json.loads(node_value)
 
@@ -118,11 +154,11 @@ class Consul:
                     logging.error("ip_address missing in %s", node)
                     continue
 
-                ip_address = node_data["ip_address"]
-                mysql_nodes.append(ip_address)
+                node_records.append(node_data)
 
-        return mysql_nodes
+        return node_records
 
+    @Metrics.time_consul_operation
     def get_mysql_server_id(self):
         """
         Get the MySQL server id from consul
@@ -174,6 +210,7 @@ class Consul:
 
         raise Exception("Unable to determine server id")
 
+    @Metrics.time_consul_operation
     def is_replication_leader(self):
         """
         Test if this is the MySQL replication leader or not
@@ -192,6 +229,7 @@ class Consul:
 
         return leader_session == self.node_health_session
 
+    @Metrics.time_consul_operation
     def get_replication_leader_ip(self):
         """
         Get the IP of the current replication ledear
@@ -210,6 +248,7 @@ class Consul:
 
         return server_data['ip_address']
 
+    @Metrics.time_consul_operation
     def try_to_become_replication_leader(self):
         """
         Try to get the new replication leader
@@ -239,6 +278,205 @@ class Consul:
         return False
 
 
+    @Metrics.time_consul_operation
+    def try_to_acquire_backup_lock(self, lock_key=None):
+        """
+        Try to get the lock for creating a backup or another lock
+        (released automatically if the node is gone)
+        """
+        json_string = json.dumps({
+            'ip_address': Utils.get_local_ip_address(),
+            'timestamp': time.time()
+        })
+
+        return self.client.kv.put(lock_key or Consul.backup_lock_key, json_string,
+                                  acquire=self.node_health_session)
+
+    @Metrics.time_consul_operation
+    def release_backup_lock(self, lock_key=None):
+        """
+        Release the backup lock or another lock
+        """
+        return self.client.kv.put(lock_key or Consul.backup_lock_key, "",
+                                  release=self.node_health_session)
+
+    @Metrics.time_consul_operation
+    def add_backup_to_catalog(self, record):
+        """
+        Add the backup to the catalog. The catalog entry and the latest
+        backup are updated atomically in one transaction.
+        """
+        key = f"{Consul.backup_catalog_path}{record['name']}"
+        value = base64.b64encode(json.dumps(record).encode()).decode()
+
+        for _ in range(Consul.retry_counter):
+            result = self.client.kv.get(Consul.latest_backup_key)
+            operations = [{"KV": {"Verb": "set", "Key": key, "Value": value}}]
+
+            # Update the latest backup (cas prevents lost updates)
+            latest_backup = result[1]
+            if latest_backup is None or \
+                json.loads(latest_backup['Value'])['timestamp'] <= record['timestamp']:
+
+                version = 0 if latest_backup is None else latest_backup['ModifyIndex']
+                operations.append({"KV": {"Verb": "cas", "Key": Consul.latest_backup_key,
+                                          "Value": value, "Index": version}})
+
+            try:
+                self.client.txn.put(operations)
+                logging.debug("Added backup %s to the catalog", record['name'])
+                return True
+            except pyconsul.ConsulException as error:
+                logging.debug("Unable to update backup catalog, retrying %s", error)
+                time.sleep(1)
+
+        logging.error("Unable to add backup %s to the catalog", record['name'])
+        return False
+
+    @Metrics.time_consul_operation
+    def update_backup_in_catalog(self, record):
+        """
+        Update the catalog entry of the backup (and the latest backup, if
+        it is the same backup). The entries are only updated if they were
+        not changed or removed in the meantime (e.g., by the retention).
+        """
+        key = f"{Consul.backup_catalog_path}{record['name']}"
+        value = base64.b64encode(json.dumps(record).encode()).decode()
+
+        entry = self.client.kv.get(key)[1]
+
+        if entry is None:
+            logging.debug("Backup %s is not in the catalog, skipping update", record['name'])
+            return False
+
+        operations = [{"KV": {"Verb": "cas", "Key": key, "Value": value,
+                              "Index": entry['ModifyIndex']}}]
+
+        latest_backup = self.client.kv.get(Consul.latest_backup_key)[1]
+        if latest_backup is not None and \
+            json.loads(latest_backup['Value'])['name'] == record['name']:
+
+            operations.append({"KV": {"Verb": "cas", "Key": Consul.latest_backup_key,
+                                      "Value": value, "Index": latest_backup['ModifyIndex']}})
+
+        try:
+            self.client.txn.put(operations)
+            return True
+        except pyconsul.ConsulException as error:
+            logging.warning("Unable to update backup %s in the catalog: %s", record['name'], error)
+            return False
+
+    def remove_backups_from_catalog(self, backup_names):
+        """
+        Remove the backups from the catalog
+        """
+        return self.delete_keys([f"{Consul.backup_catalog_path}{backup_name}"
+                                 for backup_name in backup_names])
+
+    @Metrics.time_consul_operation
+    def delete_keys(self, keys):
+        """
+        Delete the KV entries in batches (a transaction contains
+        at most 64 operations)
+        """
+        for position in range(0, len(keys), 64):
+            operations = [{"KV": {"Verb": "delete", "Key": key}}
+                          for key in keys[position:position + 64]]
+
+            try:
+                self.client.txn.put(operations)
+            except pyconsul.ConsulException as error:
+                logging.error("Unable to delete KV entries: %s", error)
+                return False
+
+        return True
+
+    @Metrics.time_consul_operation
+    def get_latest_backup_record(self):
+        """
+        Get the catalog entry of the latest backup
+        """
+        result = self.client.kv.get(Consul.latest_backup_key)
+
+        if result[1] is None:
+            return None
+
+        return json.loads(result[1]['Value'])
+
+    @Metrics.time_consul_operation
+    def get_backup_record(self, backup_name):
+        """
+        Get the catalog entry of the given backup
+        """
+        result = self.client.kv.get(f"{Consul.backup_catalog_path}{backup_name}")
+
+        if result[1] is None:
+            return None
+
+        return json.loads(result[1]['Value'])
+
+    @Metrics.time_consul_operation
+    def get_backup_records(self):
+        """
+        Get all catalog entries
+        """
+        records = []
+        result = self.client.kv.get(Consul.backup_catalog_path, recurse=True)
+
+        if result[1] is not None:
+            for entry in result[1]:
+                records.append(json.loads(entry['Value']))
+
+        return records
+
+    @Metrics.time_consul_operation
+    def add_binlog_to_index(self, record):
+        """
+        Add an archived binlog file to the index
+        """
+        key = f"{Consul.binlog_index_path}{record['server_uuid']}/{record['file']}"
+        return self.client.kv.put(key, json.dumps(record))
+
+    def remove_binlogs_from_index(self, records):
+        """
+        Remove archived binlog files from the index
+        """
+        return self.delete_keys([f"{Consul.binlog_index_path}{record['server_uuid']}/{record['file']}"
+                                 for record in records])
+
+    @Metrics.time_consul_operation
+    def get_binlog_records(self):
+        """
+        Get the records of all archived binlog files
+        """
+        records = []
+        result = self.client.kv.get(Consul.binlog_index_path, recurse=True)
+
+        if result[1] is not None:
+            for entry in result[1]:
+                records.append(json.loads(entry['Value']))
+
+        return records
+
+    @Metrics.time_consul_operation
+    def get_mysql_options(self):
+        """
+        Get the MySQL options that are set for the whole cluster
+        """
+        options = {}
+        result = self.client.kv.get(Consul.mysql_config_path, recurse=True)
+
+        if result[1] is not None:
+            for entry in result[1]:
+                option = entry['Key'][len(Consul.mysql_config_path):]
+
+                # Skip the folder entry
+                if option and entry['Value'] is not None:
+                    options[option] = entry['Value'].decode()
+
+        return options
+
+    @Metrics.time_consul_operation
     def register_service(self, leader=False, port=3306):
         """
         Register the MySQL primary service
@@ -264,6 +502,7 @@ class Consul:
         logging.info("Register new service_id=%s, tags=%s", service_id, tags)
         self.client.agent.service.register("mysql", service_id=service_id, port=port, tags=tags)
 
+    @Metrics.time_consul_operation
     def register_node(self, mysql_version=None, server_id=None):
         """
         Register the node in Consul
@@ -271,11 +510,36 @@ class Consul:
         logging.debug("Register MySQL instance in Consul")
         ip_address = Utils.get_local_ip_address()
 
-        json_string = json.dumps({
+        # The replication status is published by the main event loop
+        self.node_record = {
             'ip_address': ip_address,
             'server_id': server_id,
-            'mysql_version': mysql_version
-        })
+            'mysql_version': mysql_version,
+            'replication_lag': None,
+            'replication_running': False,
+            'threads_running': 0
+        }
+
+        return self.write_node_record()
+
+    @Metrics.time_consul_operation
+    def update_node_status(self, node_status):
+        """
+        Publish the replication status and the load of the node
+        """
+        if self.node_record is None:
+            logging.error("Node is not registered, unable to publish status")
+            return False
+
+        self.node_record.update(node_status)
+        return self.write_node_record()
+
+    def write_node_record(self):
+        """
+        Write the node record (bound to the node health session)
+        """
+        ip_address = self.node_record['ip_address']
+        json_string = json.dumps(self.node_record)
 
         path = f"{Consul.instances_path}{ip_address}"
         logging.debug("Consul: Path %s, value %s (session %s)",
@@ -289,6 +553,7 @@ class Consul:
 
         return True
 
+    @Metrics.time_consul_operation
     def refresh_sessions(self):
         """
         Refresh the active sessions
@@ -297,8 +562,16 @@ class Consul:
 
         for session in self.active_sessions:
             logging.debug("Refreshing session %s", session)
-            self.client.session.renew(session)
 
+            try:
+                self.client.session.renew(session)
+            except (pyconsul.ConsulException, requests.exceptions.RequestException):
+                Metrics.session_renewals.labels("failure").inc()
+                raise
+
+            Metrics.session_renewals.labels("success").inc()
+
+    @Metrics.time_consul_operation
     def create_session(self, name, behavior='release', ttl=None, lock_delay=15):
         """
         Create a new session.
@@ -320,6 +593,7 @@ class Consul:
         return session_id
 
 
+    @Metrics.time_consul_operation
     def destroy_session(self, session_id):
         """
         Destory a previosly registered session
@@ -361,3 +635,96 @@ class Consul:
         consul_process = subprocess.Popen(consul_args)
 
         return consul_process
+
+    @staticmethod
+    def wait_for_agent(timeout=120):
+        """
+        Wait until the local Consul agent is connected to the cluster
+        """
+        client = pyconsul.Consul(host="localhost")
+
+        for _ in range(timeout):
+            try:
+                if client.status.leader():
+                    logging.debug("Consul agent is ready")
+                    return True
+            except (pyconsul.ConsulException, requests.exceptions.ConnectionError):
+                pass
+
+            time.sleep(1)
+
+        logging.error("Consul agent is not ready after %i seconds", timeout)
+        return False
+
+
+class KVWatcher:
+    """
+    Watch a KV path by using Consul blocking queries. The given
+    callback is called on every change of the path.
+    """
+
+    def __init__(self, path, callback, recurse=False, wait="30s"):
+        """
+        Init the watcher
+        """
+        self.path = path
+        self.callback = callback
+        self.recurse = recurse
+        self.wait = wait
+        self.index = None
+        self.run_watcher = False
+        self.watcher_thread = None
+
+        # Blocking queries need their own client (and HTTP connection)
+        self.client = pyconsul.Consul(host="localhost")
+
+    def start(self):
+        """
+        Start the watcher thread
+        """
+        logging.info("Starting Consul watcher for %s", self.path)
+        self.run_watcher = True
+        self.watcher_thread = threading.Thread(target=self.watch, daemon=True)
+        self.watcher_thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the watcher thread (returns after the running query is done
+        or the timeout is reached)
+        """
+        logging.info("Stopping Consul watcher for %s", self.path)
+        self.run_watcher = False
+        if self.watcher_thread is not None:
+            self.watcher_thread.join(timeout)
+            self.watcher_thread = None
+
+    def watch(self):
+        """
+        Perform blocking queries until the watcher is stopped
+        """
+        while self.run_watcher:
+            try:
+                index, _ = self.client.kv.get(self.path, index=self.index,
+                                              wait=self.wait, recurse=self.recurse)
+            except (pyconsul.ConsulException, requests.exceptions.RequestException) as error:
+                logging.warning("Consul watcher for %s failed, retrying %s", self.path, error)
+                self.index = None
+                time.sleep(1)
+                continue
+
+            # No callbacks after the watcher is stopped
+            if not self.run_watcher:
+                break
+
+            # The index is reset (e.g., after a Consul server restart)
+            if self.index is not None and int(index) < int(self.index):
+                self.index = None
+                self.callback()
+                continue
+
+            if index != self.index:
+                if self.index is not None:
+                    logging.debug("Consul path %s has changed (index=%s)", self.path, index)
+                    self.callback()
+
+                self.index = index
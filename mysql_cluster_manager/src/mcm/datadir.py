@@ -0,0 +1,227 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import logging
+import subprocess
+
+import mysql.connector
+
+from mcm.consul import Consul
+from mcm.mysql import Mysql
+from mcm.staging import Staging
+from mcm.utils import Utils
+
+
+class Datadir:
+    """
+    Provide the local datadir without restoring a backup. The datadir of
+    a restarted node is reused if it is up to date, and a new follower
+    can clone the data of a running node.
+    """
+
+    @staticmethod
+    def is_up_to_date(backup_record):
+        """
+        Does the existing datadir contain all transactions of the backup?
+        The GTIDs of the backup are compared, the LSN is used for older
+        backups of the same server. A follower also must not contain
+        transactions that are unknown to the replication leader.
+        """
+        if not os.path.isfile(f"{Mysql.mysql_datadir}/ib_logfile0"):
+            return False
+
+        logging.info("Checking the existing datadir")
+
+        # Crash recovery can take some time
+        mysql_process = Mysql.server_start(exit_on_error=False, timeout=600,
+                                           options=["--skip-slave-start"])
+
+        if mysql_process is None:
+            logging.warning("Unable to start MySQL on the existing datadir")
+            return False
+
+        try:
+            gtid_executed = Mysql.execute_query_as_root("SELECT @@GLOBAL.gtid_executed")[0]['@@GLOBAL.gtid_executed']
+            server_uuid = Mysql.execute_query_as_root("SELECT @@GLOBAL.server_uuid")[0]['@@GLOBAL.server_uuid']
+
+            if backup_record.get('gtid_executed'):
+                up_to_date = Mysql.is_gtid_subset(backup_record['gtid_executed'], gtid_executed)
+            elif backup_record.get('server_uuid') == server_uuid and 'to_lsn' in backup_record:
+                up_to_date = Datadir.get_lsn() >= backup_record['to_lsn']
+            else:
+                up_to_date = False
+
+            if up_to_date:
+                up_to_date = Datadir.is_known_by_leader(gtid_executed)
+        except mysql.connector.Error as err:
+            logging.warning("Unable to check the existing datadir: %s", err)
+            up_to_date = False
+        finally:
+            Mysql.server_stop()
+            mysql_process.wait()
+
+        return up_to_date
+
+    @staticmethod
+    def get_lsn():
+        """
+        Get the current log sequence number of InnoDB
+        """
+        status = Mysql.execute_query_as_root("SHOW ENGINE INNODB STATUS")[0]['Status']
+
+        for line in status.splitlines():
+            if line.startswith("Log sequence number"):
+                return int(line.split()[-1])
+
+        return 0
+
+    @staticmethod
+    def is_known_by_leader(gtid_set):
+        """
+        Are all transactions of the GTID set executed by the replication
+        leader? True if this node is the leader or no leader exists.
+        """
+        leader_ip = Consul.get_instance().get_replication_leader_ip()
+
+        if leader_ip is None or leader_ip == Utils.get_local_ip_address():
+            return True
+
+        cnx = mysql.connector.connect(host=leader_ip, port=3306, user='root',
+                                      password=os.environ.get("MYSQL_ROOT_PASSWORD"))
+
+        try:
+            cursor = cnx.cursor()
+            cursor.execute("SELECT GTID_SUBSET(%s, @@GLOBAL.gtid_executed)", (gtid_set,))
+            known = cursor.fetchone()[0] == 1
+        finally:
+            cnx.close()
+
+        if not known:
+            logging.warning("Datadir contains transactions that are unknown to the leader")
+
+        return known
+
+    @staticmethod
+    def get_clone_donor():
+        """
+        Get the IP of the node to clone the data from. MCM_CLONE_DONOR is
+        'leader' (default), 'replica' (the follower with the lowest
+        replication lag), or the IP of a node.
+        """
+        donor = os.getenv('MCM_CLONE_DONOR', "leader")
+        consul = Consul.get_instance()
+        leader_ip = consul.get_replication_leader_ip()
+
+        if donor == "leader":
+            return leader_ip
+
+        if donor != "replica":
+            return donor
+
+        replicas = [node_record for node_record in consul.get_all_registered_node_records()
+                    if node_record['ip_address'] != leader_ip
+                    and node_record.get('replication_running')
+                    and node_record.get('replication_lag') is not None]
+
+        if not replicas:
+            logging.info("No running replica found, cloning from the leader")
+            return leader_ip
+
+        return min(replicas, key=lambda node_record: node_record['replication_lag'])['ip_address']
+
+    @staticmethod
+    def clone_from_donor():
+        """
+        Copy the data of a running node with the MySQL clone plugin. A
+        temporary instance is initialized and its data is replaced by
+        the snapshot of the donor; mysqld_safe restarts the server on
+        the cloned data afterwards.
+        """
+        donor_ip = Datadir.get_clone_donor()
+
+        if donor_ip is None:
+            logging.info("No clone donor available")
+            return False
+
+        logging.info("Cloning MySQL data from %s", donor_ip)
+        start_time = time.time()
+
+        Staging.move_away(Mysql.mysql_datadir)
+        mysql_init = [Mysql.mysqld_binary, "--initialize-insecure", "--user=mysql",
+                      f"--datadir={Mysql.mysql_datadir}"]
+
+        if subprocess.run(mysql_init, check=False).returncode != 0:
+            logging.error("Unable to initialize the datadir for the clone")
+            return False
+
+        mysql_process = Mysql.server_start(use_root_password=False, exit_on_error=False)
+
+        if mysql_process is None:
+            logging.error("Unable to start MySQL for the clone")
+            return False
+
+        replication_user = os.environ.get("MYSQL_REPLICATION_USER")
+        replication_password = os.environ.get("MYSQL_REPLICATION_PASSWORD")
+        root_password = os.environ.get("MYSQL_ROOT_PASSWORD")
+
+        Mysql.execute_statement(f"SET GLOBAL clone_valid_donor_list = '{donor_ip}:3306'")
+
+        try:
+            cnx = mysql.connector.connect(user='root', unix_socket='/var/run/mysqld/mysqld.sock')
+            cnx.cursor().execute(f"CLONE INSTANCE FROM '{replication_user}'@'{donor_ip}':3306 "
+                                 f"IDENTIFIED BY '{replication_password}'")
+            cnx.close()
+        except mysql.connector.Error as err:
+            # The connection is lost when the server restarts on the cloned data
+            if err.errno not in (mysql.connector.errorcode.CR_SERVER_LOST,
+                                 mysql.connector.errorcode.CR_SERVER_GONE_ERROR):
+                logging.error("Unable to clone data from %s: %s", donor_ip, err)
+                Mysql.execute_statement(sql="SHUTDOWN")
+                mysql_process.wait()
+                return False
+
+        # The cloned data contains the users (and the root password) of the donor
+        if not Mysql.wait_for_connection(password=root_password, exit_on_error=False):
+            logging.error("MySQL is not available after the clone from %s", donor_ip)
+            mysql_process.kill()
+            mysql_process.wait()
+            subprocess.run(["/usr/bin/pkill", "-KILL", "-x", "mysqld"], check=False)
+            return False
+
+        try:
+            clone_status = Mysql.execute_query_as_root("SELECT STATE, ERROR_MESSAGE FROM "
+                                                       "performance_schema.clone_status")
+        except mysql.connector.Error as err:
+            logging.error("Unable to read the clone status: %s", err)
+            clone_status = None
+
+        Mysql.execute_statement(sql="SHUTDOWN", password=root_password)
+        mysql_process.wait()
+
+        if not clone_status or clone_status[0]['STATE'] != "Completed":
+            logging.error("Unable to clone data from %s: %s", donor_ip, clone_status)
+            return False
+
+        Mysql.record_restore_phase("clone", time.time() - start_time)
+        Mysql.record_restore_phase("total", time.time() - start_time)
+        logging.info("MySQL data was successfully cloned from %s (duration=%.1fs)",
+                     donor_ip, time.time() - start_time)
+
+        return True
+
+    @staticmethod
+    def clone_from_donor_if_configured():
+        """
+        Clone the data of a running node, if MCM_JOIN_MODE is set to
+        'clone'. Returns False if the data has to be restored from the
+        backups instead.
+        """
+        if os.getenv('MCM_JOIN_MODE', "backup") != "clone":
+            return False
+
+        try:
+            return Datadir.clone_from_donor()
+        except (mysql.connector.Error, subprocess.CalledProcessError) as err:
+            logging.error("Unable to clone data, using the backups: %s", err)
+            return False
@@ -0,0 +1,116 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import logging
+
+from mcm.consul import Consul
+from mcm.mysql import Mysql
+from mcm.utils import Utils
+
+class LeaderElection:
+    """
+    The election of a new replication leader. When the leader is gone,
+    every candidate publishes its GTID sets in its instance record. A
+    candidate defers its promotion while another candidate has a superset
+    of its transactions, so the most up-to-date follower becomes leader.
+    """
+
+    def __init__(self):
+        """
+        Init the election
+        """
+        self.election_start = None
+
+    @staticmethod
+    def get_election_wait():
+        """
+        Get the time the candidates wait for the GTID sets of the others
+        """
+        return float(os.getenv('MCM_ELECTION_WAIT', "2"))
+
+    @staticmethod
+    def get_election_timeout():
+        """
+        Get the time after which every candidate can become leader
+        """
+        return float(os.getenv('MCM_ELECTION_TIMEOUT', "30"))
+
+    @staticmethod
+    def get_gtid_status(node_status):
+        """
+        Get the GTID part of the node record
+        """
+        return {
+            'gtid_executed': node_status['gtid_executed'],
+            'retrieved_gtid_set': node_status['retrieved_gtid_set'],
+            'gtid_timestamp': time.time()
+        }
+
+    @staticmethod
+    def get_transactions(node_record):
+        """
+        Get the GTID set of the executed and the retrieved transactions
+        """
+        gtid_sets = [node_record.get('gtid_executed'), node_record.get('retrieved_gtid_set')]
+        return ",".join(gtid_set for gtid_set in gtid_sets if gtid_set)
+
+    def get_promotion_delay(self):
+        """
+        Get the delay before this candidate should try to become the leader.
+        None is returned if a replication leader exists, 0 if the candidate
+        should try now.
+        """
+        consul = Consul.get_instance()
+
+        if consul.get_replication_leader_ip() is not None:
+            self.election_start = None
+            return None
+
+        ip_address = Utils.get_local_ip_address()
+        node_status = Mysql.get_node_status()
+
+        if self.election_start is None:
+            logging.info("Replication leader is gone, publishing GTID sets for the election")
+            self.election_start = time.time()
+
+        # The GTID sets grow while the relay log is applied
+        consul.update_node_status(LeaderElection.get_gtid_status(node_status))
+
+        # Only live nodes that have processed the replication data can become leader
+        other_candidates = [node_record for node_record
+                            in consul.get_all_registered_node_records(locked_only=True)
+                            if node_record['ip_address'] != ip_address
+                            and node_record.get('leader_candidate')]
+
+        if not other_candidates:
+            return 0
+
+        elapsed_time = time.time() - self.election_start
+
+        if elapsed_time < LeaderElection.get_election_wait():
+            return LeaderElection.get_election_wait() - elapsed_time
+
+        if elapsed_time > LeaderElection.get_election_timeout():
+            logging.warning("No replication leader elected after %.1fs, trying to become leader",
+                            elapsed_time)
+            return 0
+
+        own_transactions = LeaderElection.get_transactions(node_status)
+
+        for node_record in other_candidates:
+            # Only the GTID sets published for this election are compared
+            published = node_record.get('gtid_timestamp')
+            if published is None or published < self.election_start - LeaderElection.get_election_wait():
+                continue
+
+            transactions = LeaderElection.get_transactions(node_record)
+
+            if Mysql.is_gtid_subset(own_transactions, transactions) and \
+                not Mysql.is_gtid_subset(transactions, own_transactions):
+
+                logging.info("Node %s has more transactions, deferring promotion",
+                             node_record['ip_address'])
+                return 1
+
+        return 0
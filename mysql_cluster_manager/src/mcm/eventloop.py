@@ -0,0 +1,306 @@
+"""This file contains the main event loop of the cluster manager"""
+
+import os
+import time
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from mcm.binlog import BinlogArchive
+from mcm.connection import ConnectionPool
+from mcm.consul import Consul, KVWatcher
+from mcm.election import LeaderElection
+from mcm.metrics import Metrics
+from mcm.mysql import Mysql
+from mcm.proxysql import Proxysql
+from mcm.retention import RetentionPolicy
+from mcm.verification import BackupVerification
+
+class EventLoop:
+    """
+    The main event loop of the join_or_bootstrap action. Every job
+    runs as an independent periodic task. Blocking calls (MySQL, Consul,
+    subprocesses) are dispatched to executors, so a slow job can not
+    delay the refresh of the Consul sessions.
+    """
+
+    # Interval of the session renewal
+    session_refresh_interval = 5
+
+    # Fallback interval of the leader and ProxySQL checks (changes
+    # are reported by the Consul watchers)
+    cluster_check_interval = 30
+
+    # Interval of the replication monitoring
+    replication_check_interval = 5
+
+    # Interval of the backup check
+    backup_check_interval = 5 * 60
+
+    # Interval of the backup verification
+    backup_verify_interval = int(os.getenv('MCM_BACKUP_VERIFY_INTERVAL', "3600"))
+
+    # Interval of the backup retention
+    retention_interval = int(os.getenv('MCM_RETENTION_INTERVAL', "3600"))
+
+    # Interval of the binlog archiving
+    binlog_archive_interval = int(os.getenv('MCM_BINLOG_ARCHIVE_INTERVAL', "60"))
+
+    # Interval of the process monitoring
+    process_check_interval = 1
+
+    # Time to wait for the running query of a watcher on shutdown
+    watcher_stop_timeout = 5
+
+    def __init__(self, consul_process, mysql_process):
+        """
+        Init the event loop
+        """
+        self.consul_process = consul_process
+        self.mysql_process = mysql_process
+        self.able_to_become_leader = False
+        self.election = LeaderElection()
+        self.proxysql = Proxysql()
+        self.binlog_archive = BinlogArchive()
+
+        # Session renewals get their own executor and can not be starved
+        self.session_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session")
+        self.backup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup")
+        self.verification_executor = ThreadPoolExecutor(max_workers=1,
+                                                        thread_name_prefix="verification")
+
+        # The S3 transfers of the archiving and the retention can not delay the failover
+        self.binlog_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="binlog")
+        self.retention_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retention")
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="worker")
+
+        # Set on changes of the replication leader and the instances
+        self.loop = None
+        self.leader_changed = None
+        self.instances_changed = None
+
+        # The last node status published in Consul
+        self.published_node_status = None
+
+    def run(self):
+        """
+        Run the event loop (returns only on shutdown)
+        """
+        try:
+            asyncio.run(self.main())
+        finally:
+            logging.info("Event loop stopped, closing the MySQL connections")
+            ConnectionPool.close_all()
+
+    async def main(self):
+        """
+        Start the watchers and the periodic tasks
+        """
+        self.loop = asyncio.get_running_loop()
+        self.leader_changed = asyncio.Event()
+        self.instances_changed = asyncio.Event()
+
+        # The ProxySQL backends depend on the instances and the leader
+        watchers = [
+            KVWatcher(Consul.replication_leader_path,
+                      lambda: self.notify(self.leader_changed, self.instances_changed)),
+            KVWatcher(Consul.instances_path,
+                      lambda: self.notify(self.instances_changed), recurse=True)
+        ]
+
+        for watcher in watchers:
+            watcher.start()
+
+        try:
+            await self.run_tasks()
+        finally:
+            # Stop the watchers while the loop can still process their notifications
+            for watcher in watchers:
+                watcher.stop(timeout=EventLoop.watcher_stop_timeout)
+
+    async def run_tasks(self):
+        """
+        Run the periodic tasks
+        """
+        await asyncio.gather(
+            self.run_periodic("session renewal", self.refresh_sessions,
+                              EventLoop.session_refresh_interval, self.session_executor),
+            self.run_periodic("leader watch", self.check_replication_leader,
+                              EventLoop.cluster_check_interval, self.executor,
+                              self.leader_changed),
+            self.run_periodic("ProxySQL sync", self.update_proxysql,
+                              EventLoop.cluster_check_interval, self.executor,
+                              self.instances_changed),
+            self.run_periodic("replication monitoring", self.check_replication,
+                              EventLoop.replication_check_interval, self.executor),
+            self.run_periodic("backup", self.create_backup_if_needed,
+                              EventLoop.backup_check_interval, self.backup_executor),
+            self.run_periodic("backup verification", BackupVerification.verify_if_needed,
+                              EventLoop.backup_verify_interval, self.verification_executor),
+            self.run_periodic("backup retention", RetentionPolicy.apply_if_needed,
+                              EventLoop.retention_interval, self.retention_executor),
+            self.run_periodic("binlog archiving", self.binlog_archive.archive_if_needed,
+                              EventLoop.binlog_archive_interval, self.binlog_executor),
+            self.run_periodic("process monitoring", self.poll_processes,
+                              EventLoop.process_check_interval, self.executor))
+
+    @staticmethod
+    async def run_periodic(name, function, interval, executor, event=None):
+        """
+        Execute the function in the executor every interval seconds
+        or when the event is set
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if event is not None:
+                event.clear()
+
+            start_time = time.time()
+
+            try:
+                await loop.run_in_executor(executor, function)
+            except Exception: # pylint: disable=broad-except
+                logging.exception("Task %s failed", name)
+                Metrics.task_failures.labels(name).inc()
+
+            Metrics.task_duration.labels(name).observe(time.time() - start_time)
+
+            if event is None:
+                await asyncio.sleep(interval)
+                continue
+
+            try:
+                await asyncio.wait_for(event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self, *events):
+        """
+        Set the events (can be called from other threads)
+        """
+        for event in events:
+            self.loop.call_soon_threadsafe(event.set)
+
+    def notify_later(self, delay, event):
+        """
+        Set the event after the delay (can be called from other threads)
+        """
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, event.set)
+
+    @staticmethod
+    def quantize(value, steps):
+        """
+        Round the value down to the next step
+        """
+        if value is None:
+            return None
+
+        return max((step for step in steps if step <= value), default=0)
+
+    @staticmethod
+    def refresh_sessions():
+        """
+        Keep the Consul sessions alive
+        """
+        Consul.get_instance().refresh_sessions()
+
+    def poll_processes(self):
+        """
+        Poll the Consul and MySQL processes
+        """
+        self.consul_process.poll()
+        self.mysql_process.poll()
+
+    def check_replication(self):
+        """
+        Are the replication data completely processed (i.e., the data from the
+        leader is stored locally and we can become the new leader?)
+        """
+        node_status = Mysql.get_node_status()
+        replication_lag = node_status['replication_lag']
+        Metrics.replication_lag.set(float("nan") if replication_lag is None else replication_lag)
+
+        if not self.able_to_become_leader and Mysql.is_repliation_data_processed():
+            logging.info("All replication data are read, node can become replication leader")
+            self.able_to_become_leader = True
+            self.notify(self.leader_changed)
+
+        self.publish_node_status(node_status)
+
+    def publish_node_status(self, node_status):
+        """
+        Publish the node status in Consul (used for the ProxySQL routing and
+        the leader election). The routing values are rounded and only changes
+        are published, so the instances watchers of the other nodes are not
+        triggered by every check. The GTID sets are published whenever they
+        change, the election compares them.
+        """
+        published_node_status = {
+            'replication_lag': EventLoop.quantize(node_status['replication_lag'],
+                                                  (0, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800, 3600)),
+            'replication_running': node_status['replication_running'],
+            'threads_running': EventLoop.quantize(node_status['threads_running'],
+                                                  (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)),
+            'leader_candidate': self.able_to_become_leader,
+            'gtid_executed': node_status['gtid_executed'],
+            'retrieved_gtid_set': node_status['retrieved_gtid_set']
+        }
+
+        if published_node_status == self.published_node_status:
+            return
+
+        logging.debug("Publishing node status %s", published_node_status)
+        gtid_status = LeaderElection.get_gtid_status(node_status)
+        if Consul.get_instance().update_node_status({**published_node_status, **gtid_status}):
+            self.published_node_status = published_node_status
+
+    def update_proxysql(self):
+        """
+        Update the ProxySQL backends
+        """
+        node_records = Consul.get_instance().get_all_registered_node_records()
+        leader_ip = Consul.get_instance().get_replication_leader_ip()
+        self.proxysql.update_mysql_server_if_needed(node_records, leader_ip)
+
+    def check_replication_leader(self):
+        """
+        Try to replace a failed replication leader and follow
+        the current replication leader
+        """
+        replication_leader = Consul.get_instance().is_replication_leader()
+
+        # Try to become new leader (if no other candidate is more up-to-date)
+        if not replication_leader and self.able_to_become_leader:
+            promotion_delay = self.election.get_promotion_delay()
+
+            if promotion_delay:
+                self.notify_later(promotion_delay, self.leader_changed)
+
+            promotion = promotion_delay == 0 and \
+                Consul.get_instance().try_to_become_replication_leader()
+
+            # Are we the new leader?
+            if promotion:
+                Mysql.delete_replication_config()
+                Consul.get_instance().register_service(True)
+                Metrics.leader_changes.labels("promotion").inc()
+                replication_leader = True
+
+        # Check for correct replication leader
+        if not replication_leader:
+            real_leader = Consul.get_instance().get_replication_leader_ip()
+            configured_leader = Mysql.get_replication_leader_ip()
+
+            if real_leader is not None and real_leader != configured_leader:
+                logging.info("Replication leader change (old=%s, new=%s)", configured_leader, real_leader)
+                Mysql.change_to_replication_client(real_leader)
+                Metrics.leader_changes.labels("follow").inc()
+
+    @staticmethod
+    def create_backup_if_needed():
+        """
+        Create MySQL Backups (runs in the backup executor)
+        """
+        Mysql.create_backup_if_needed(background=False)
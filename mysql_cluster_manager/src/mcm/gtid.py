@@ -0,0 +1,64 @@
+"""This file is part of the MySQL cluster manager"""
+
+
+class Gtid:
+    """
+    Operations on GTID sets (e.g., 3E11FA47-71CA-11E1-9E33-C80AA9429562:1-5:7,
+    <uuid>:1-3) that are needed while no MySQL server is running
+    """
+
+    @staticmethod
+    def parse(gtid_set):
+        """
+        Parse the GTID set into a dict (uuid -> list of (start, end) intervals)
+        """
+        result = {}
+
+        if not gtid_set:
+            return result
+
+        for entry in gtid_set.replace("\n", "").split(","):
+            entry = entry.strip()
+
+            if not entry:
+                continue
+
+            uuid, *intervals = entry.split(":")
+            uuid = uuid.lower()
+
+            for interval in intervals:
+                start, _, end = interval.partition("-")
+                result.setdefault(uuid, []).append((int(start), int(end or start)))
+
+        return result
+
+    @staticmethod
+    def contains_interval(intervals, interval):
+        """
+        Is the interval covered by the list of intervals
+        """
+        start, end = interval
+        position = start
+
+        for interval_start, interval_end in sorted(intervals):
+            if interval_start <= position <= interval_end:
+                position = interval_end + 1
+
+            if position > end:
+                return True
+
+        return False
+
+    @staticmethod
+    def is_subset(subset, superset):
+        """
+        Are all transactions of the first GTID set contained in the second set?
+        """
+        superset_intervals = Gtid.parse(superset)
+
+        for uuid, intervals in Gtid.parse(subset).items():
+            for interval in intervals:
+                if not Gtid.contains_interval(superset_intervals.get(uuid, []), interval):
+                    return False
+
+        return True
@@ -0,0 +1,124 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import logging
+import functools
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, REGISTRY
+
+from mcm.connection import ConnectionPool
+
+class Metrics:
+    """
+    The Prometheus metrics of the cluster manager
+    """
+
+    # Buckets for long running operations (backup, restore)
+    long_buckets = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+    task_duration = Histogram("mcm_task_duration_seconds",
+                              "Duration of the event loop tasks", ["task"])
+
+    task_failures = Counter("mcm_task_failures_total",
+                            "Failed executions of the event loop tasks", ["task"])
+
+    consul_duration = Histogram("mcm_consul_request_duration_seconds",
+                                "Latency of the Consul operations", ["operation"])
+
+    session_renewals = Counter("mcm_consul_session_renewals_total",
+                               "Renewals of the Consul sessions", ["result"])
+
+    backups = Counter("mcm_backups_total", "Backup runs", ["result"])
+
+    backup_duration = Histogram("mcm_backup_duration_seconds",
+                                "Duration of the backups", ["type"], buckets=long_buckets)
+
+    backup_bytes = Counter("mcm_backup_bytes_total",
+                           "Bytes uploaded by the backups", ["type"])
+
+    backup_throttle_pauses = Counter("mcm_backup_throttle_pauses_total",
+                                     "Pauses of the backups due to the server load")
+
+    backup_throttle_seconds = Counter("mcm_backup_throttle_seconds_total",
+                                      "Time the backups were paused due to the server load")
+
+    backup_throughput = Gauge("mcm_backup_throughput_bytes_per_second",
+                              "Upload throughput of the last backup")
+
+    backup_verifications = Counter("mcm_backup_verifications_total",
+                                   "Verifications of backups by a test restore", ["result"])
+
+    backup_verification_duration = Gauge("mcm_backup_verification_duration_seconds",
+                                         "Duration of the last backup verification")
+
+    restore_phase_duration = Gauge("mcm_restore_phase_duration_seconds",
+                                   "Duration of the phases of the last restore", ["phase"])
+
+    replication_lag = Gauge("mcm_replication_lag_seconds",
+                            "Replication lag of this node (NaN if not a follower)")
+
+    leader_changes = Counter("mcm_leader_changes_total",
+                             "Replication leader changes seen by this node", ["event"])
+
+    proxysql_reconfigurations = Counter("mcm_proxysql_reconfigurations_total",
+                                        "Reconfigurations of the ProxySQL backends")
+
+    # Is the HTTP server already running
+    server_started = False
+
+    @staticmethod
+    def start_server():
+        """
+        Start the HTTP server for the metrics endpoint. The port is
+        taken from MCM_METRICS_PORT (0 disables the endpoint).
+        """
+        port = int(os.getenv('MCM_METRICS_PORT', "9104"))
+
+        if port == 0 or Metrics.server_started:
+            return
+
+        logging.info("Starting metrics endpoint on port %i", port)
+        REGISTRY.register(ConnectionPoolCollector())
+        start_http_server(port)
+        Metrics.server_started = True
+
+    @staticmethod
+    def time_consul_operation(function):
+        """
+        Decorator that records the latency of a Consul operation
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start_time = time.time()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                Metrics.consul_duration.labels(function.__name__).observe(time.time() - start_time)
+
+        return wrapper
+
+
+class ConnectionPoolCollector:
+    """
+    Export the counters of the MySQL and ProxySQL connection pools
+    """
+
+    @staticmethod
+    def collect():
+        """
+        Collect the counters of all pools
+        """
+        families = {name: CounterMetricFamily(f"mcm_sql_{name}", f"SQL {name} of the connection pools",
+                                              labels=["user", "port"])
+                    for name in ("connects", "reconnects", "queries")}
+
+        for statistics in ConnectionPool.get_statistics():
+            labels = [statistics['user'], str(statistics['port'] or "socket")]
+
+            for name, family in families.items():
+                family.add_metric(labels, statistics[name])
+
+        return list(families.values())
@@ -1,105 +1,270 @@
 """This file is part of the MySQL cluster manager"""
 
 import os
+import json
+import math
 import logging
-import datetime
-import subprocess
+import threading
+
+import boto3
+import botocore.config
+import botocore.exceptions
+
+from boto3.s3.transfer import TransferConfig
 
 class Minio:
     """
     This class encapsulates all Minio related things
     """
 
-    minio_binary = "/usr/local/bin/mc"
+    # The bucket for the MySQL backups
+    bucket_name = "mysqlbackup"
+
+    # The S3 client (shared by all threads of the process)
+    __client = None
+
+    # The maximal number of parts of a multipart upload
+    max_parts = 10000
+
+    # Is the connection already set up in this process
+    connection_ready = False
+
+    # Locks for the creation of the client and the setup of the connection
+    client_lock = threading.Lock()
+    setup_lock = threading.Lock()
+
+    @staticmethod
+    def get_client():
+        """
+        Get the S3 client. The client keeps a pool of HTTP
+        connections that is reused for all requests.
+        """
+        with Minio.client_lock:
+            if Minio.__client is None:
+                concurrency = Minio.get_concurrency()
+
+                config = botocore.config.Config(max_pool_connections=concurrency * 2,
+                                                retries={'max_attempts': 5},
+                                                s3={'addressing_style': 'path'})
+
+                Minio.__client = boto3.client("s3",
+                                              endpoint_url=os.environ.get("MINIO_URL"),
+                                              aws_access_key_id=os.environ.get("MINIO_ACCESS_KEY"),
+                                              aws_secret_access_key=os.environ.get("MINIO_SECRET_KEY"),
+                                              region_name="us-east-1",
+                                              config=config)
+
+            return Minio.__client
+
+    @staticmethod
+    def get_concurrency():
+        """
+        Get the number of parallel part transfers
+        """
+        return int(os.getenv('MCM_S3_CONCURRENCY', "8"))
+
+    @staticmethod
+    def get_transfer_config(expected_size=None):
+        """
+        Get the configuration for multipart uploads and ranged downloads.
+        The size of a stream can not be determined by boto3, so the part
+        size is increased for large expected sizes (an upload can consist
+        of at most 10000 parts).
+        """
+        part_size = int(os.getenv('MCM_S3_PART_SIZE_MB', "64")) * 1024 * 1024
+
+        if expected_size is not None:
+            part_size = max(part_size, math.ceil(expected_size * 1.1 / Minio.max_parts))
+
+        return TransferConfig(multipart_threshold=part_size,
+                              multipart_chunksize=part_size,
+                              max_concurrency=Minio.get_concurrency(),
+                              use_threads=True)
 
     @staticmethod
     def setup_connection():
         """
-        Setup the MinIO agent.
+        Setup the MinIO connection and bucket. The setup is performed
+        once per process. Backups are expired by the retention policy
+        of the cluster manager, not by a lifecycle policy.
         """
 
-        logging.info("Setup MinIO agent")
+        with Minio.setup_lock:
+            if Minio.connection_ready:
+                return
 
-        minio_url = os.environ.get("MINIO_URL")
-        minio_access_key = os.environ.get("MINIO_ACCESS_KEY")
-        minio_secret_key = os.environ.get("MINIO_SECRET_KEY")
+            logging.info("Setup MinIO connection")
+            client = Minio.get_client()
 
-        bucket_name = "backup/mysqlbackup"
+            # Create bucket
+            try:
+                client.head_bucket(Bucket=Minio.bucket_name)
+            except botocore.exceptions.ClientError:
+                logging.info("Creating bucket %s", Minio.bucket_name)
+                client.create_bucket(Bucket=Minio.bucket_name)
 
-        # Register server
-        mc_args = [Minio.minio_binary, "alias", "set", "backup",
-                   minio_url, minio_access_key, minio_secret_key]
-        subprocess.run(mc_args, check=True)
+            # Remove the expire policy of older versions (7 days), it
+            # would remove the backups kept by the retention policy
+            try:
+                rules = client.get_bucket_lifecycle_configuration(
+                    Bucket=Minio.bucket_name).get('Rules', [])
+            except botocore.exceptions.ClientError:
+                rules = []
 
-        # Create bucket
-        mc_create_bucket = [Minio.minio_binary, "mb", bucket_name, "-p"]
-        subprocess.run(mc_create_bucket, check=True)
+            if any(rule.get('ID') == 'expire_rule' for rule in rules):
+                logging.info("Removing lifecycle policy of bucket %s", Minio.bucket_name)
+                client.delete_bucket_lifecycle(Bucket=Minio.bucket_name)
 
-        # Set expire policy on bucket
-        mc_set_policy_bucket = [Minio.minio_binary, "ilm", "edit", "--id=expire_rule",
-                                "-expiry-days=7", bucket_name]
-        subprocess.run(mc_set_policy_bucket, check=True)
+            Minio.connection_ready = True
 
     @staticmethod
-    def get_backup_info():
+    def get_backups():
         """
-        Get the information about backups
+        Get the names and the change dates (UTC) of all backups in the bucket
         """
         # Call Setup to ensure bucket and connection do exist
         Minio.setup_connection()
 
-        logging.debug("Searching for latest MySQL Backup")
-        mc_search = [Minio.minio_binary, "find", "backup/mysqlbackup/", "--name",
-                     "mysql*.tgz", "-print", "{time} # {base}"]
+        logging.debug("Listing MySQL Backups")
+        backups = []
+
+        paginator = Minio.get_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=Minio.bucket_name, Prefix="mysql_backup_"):
+            for element in page.get("Contents", []):
 
-        # mc find backup/mysqlbackup/ --name "mysql*.tgz" -print '{time} # {base}'
-        # 2020-11-08 08:42:12 UTC # mysql_backup_1604824911.437146.tgz
-        # 2020-11-08 08:50:53 UTC # mysql_backup_1604825437.6691067.tgz
-        # 2020-11-08 08:55:03 UTC # mysql_backup_1604825684.9835322.tgz
+                # Skip the chain records of the backups
+                if element["Key"].endswith(".json"):
+                    continue
 
-        process = subprocess.run(mc_search, check=True, capture_output=True)
-        files = process.stdout.splitlines()
+                backups.append((element["Key"], element["LastModified"]))
 
-        return files
+        return backups
 
     @staticmethod
-    def does_backup_exists():
+    def upload_stream(object_name, stream, metadata=None, expected_size=None):
         """
-        Does a old backups exists?
+        Upload all data of the stream into the given object of the
+        backup bucket. Parts are uploaded in parallel. The expected size
+        (an upper bound of the stream size) determines the part size.
         """
-        files = Minio.get_backup_info()
+        Minio.setup_connection()
+
+        logging.debug("Streaming data into object %s", object_name)
+        extra_args = {'Metadata': metadata or {}}
 
-        if not files:
-            logging.debug("S3 Bucket is empty")
+        try:
+            Minio.get_client().upload_fileobj(stream, Minio.bucket_name, object_name,
+                                              ExtraArgs=extra_args,
+                                              Config=Minio.get_transfer_config(expected_size))
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError,
+                OSError) as error:
+            logging.error("Unable to upload object %s: %s", object_name, error)
             return False
 
         return True
 
     @staticmethod
-    def get_latest_backup():
+    def download_stream(object_name, stream):
         """
-        Get the latest backup filename from the bucket
+        Write the content of the given object of the backup bucket into
+        the stream. Ranges of the object are downloaded in parallel.
         """
-        files = Minio.get_backup_info()
+        Minio.setup_connection()
 
-        newest_changedate = None
-        newest_file = None
+        logging.debug("Streaming data from object %s", object_name)
 
-        # Take the newest file
-        for element in files:
-            element_changedate, element_filename = element.decode().split("#")
+        try:
+            Minio.get_client().download_fileobj(Minio.bucket_name, object_name, stream,
+                                                Config=Minio.get_transfer_config())
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError,
+                OSError) as error:
+            logging.error("Unable to download object %s: %s", object_name, error)
+            return False
 
-            # Remove empty chars after split
-            element_changedate = element_changedate.strip()
-            element_filename = element_filename.strip()
+        return True
 
-            element_change_date = datetime.datetime.strptime(element_changedate,
-                                                             '%Y-%m-%d %H:%M:%S UTC')
+    @staticmethod
+    def get_object_metadata(object_name):
+        """
+        Get the user defined metadata of the given object
+        """
+        Minio.setup_connection()
+
+        result = Minio.get_client().head_object(Bucket=Minio.bucket_name, Key=object_name)
+        return result.get("Metadata", {})
+
+    @staticmethod
+    def remove_object(object_name):
+        """
+        Remove the given object from the backup bucket
+        """
+        logging.info("Removing object %s from bucket", object_name)
+
+        try:
+            Minio.get_client().delete_object(Bucket=Minio.bucket_name, Key=object_name)
+        except botocore.exceptions.ClientError as error:
+            logging.error("Unable to remove object %s: %s", object_name, error)
+            return False
+
+        return True
+
+    @staticmethod
+    def remove_objects(object_names):
+        """
+        Remove the given objects from the backup bucket. The objects
+        are removed in batches (at most 1000 objects per request).
+        """
+        Minio.setup_connection()
+
+        result = True
 
-            if (newest_changedate is None) or (element_change_date > newest_changedate):
-                newest_changedate = element_change_date
-                newest_file = element_filename
+        for position in range(0, len(object_names), 1000):
+            batch = object_names[position:position + 1000]
+            logging.info("Removing %i objects from bucket", len(batch))
+
+            try:
+                response = Minio.get_client().delete_objects(
+                    Bucket=Minio.bucket_name,
+                    Delete={'Objects': [{'Key': object_name} for object_name in batch],
+                            'Quiet': True})
+            except botocore.exceptions.ClientError as error:
+                logging.error("Unable to remove objects: %s", error)
+                return False
+
+            for error in response.get('Errors', []):
+                logging.error("Unable to remove object %s: %s", error['Key'], error['Message'])
+                result = False
+
+        return result
+
+    @staticmethod
+    def write_chain_record(record):
+        """
+        Store the chain record (type, base backup, LSN range) of a
+        backup as JSON next to the backup object
+        """
+        object_name = f"{record['name']}.json"
+
+        try:
+            Minio.get_client().put_object(Bucket=Minio.bucket_name, Key=object_name,
+                                          Body=json.dumps(record).encode())
+        except botocore.exceptions.ClientError as error:
+            logging.error("Unable to store chain record %s: %s", object_name, error)
+            return False
+
+        return True
+
+    @staticmethod
+    def read_chain_record(backup_name):
+        """
+        Read the chain record of the given backup (None if not present)
+        """
+        object_name = f"{backup_name}.json"
 
-        logging.debug("Newest backup file '%s', date '%s'", newest_file, newest_changedate)
+        try:
+            result = Minio.get_client().get_object(Bucket=Minio.bucket_name, Key=object_name)
+        except botocore.exceptions.ClientError:
+            logging.debug("No chain record for backup %s found", backup_name)
+            return None
 
-        return (newest_file, newest_changedate)
+        return json.loads(result["Body"].read())
@@ -3,19 +3,28 @@
 import os
 import sys
 import time
-import shutil
+import hashlib
 import logging
 import threading
 import subprocess
 
 from shutil import rmtree
-from datetime import timedelta
+from datetime import timedelta, datetime
 
 import mysql.connector
 
+from mcm.catalog import BackupCatalog
+from mcm.codec import Codec
+from mcm.connection import ConnectionPool
 from mcm.consul import Consul
+from mcm.metrics import Metrics
 from mcm.minio import Minio
-from mcm.utils import Utils
+from mcm.resources import Resources
+from mcm.restore import BackupRestore
+from mcm.staging import Staging
+from mcm.throttle import BackupThrottle
+from mcm.utils import Utils, MeteredStream
+from mcm.xtrabackup import Xtrabackup
 
 class Mysql:
 
@@ -23,10 +32,10 @@ class Mysql:
     This class encapsulates all MySQL related things
     """
 
-    xtrabackup_binary = "/usr/bin/xtrabackup"
     mysql_server_binary = "/usr/bin/mysqld_safe"
     mysqld_binary = "/usr/sbin/mysqld"
-    mysql_datadir = "/var/lib/mysql"
+    # The datadir is a subdirectory of the volume (see Staging)
+    mysql_datadir = "/var/lib/mysql/data"
 
     @staticmethod
     def init_database_if_needed():
@@ -40,7 +49,8 @@ class Mysql:
             logging.info("MySQL is already initialized, skipping")
             return False
 
-        mysql_init = [Mysql.mysqld_binary, "--initialize-insecure", "--user=mysql"]
+        mysql_init = [Mysql.mysqld_binary, "--initialize-insecure", "--user=mysql",
+                      f"--datadir={Mysql.mysql_datadir}"]
 
         subprocess.run(mysql_init, check=True)
 
@@ -78,8 +88,8 @@ class Mysql:
         replication_password = os.environ.get("MYSQL_REPLICATION_PASSWORD")
         Mysql.execute_statement_or_exit(f"CREATE USER '{replication_user}'@'%' "
                                         f"IDENTIFIED BY '{replication_password}'")
-        Mysql.execute_statement_or_exit("GRANT REPLICATION SLAVE ON *.* TO "
-                                        f"'{replication_user}'@'%'")
+        Mysql.execute_statement_or_exit("GRANT REPLICATION SLAVE, REPLICATION CLIENT, BACKUP_ADMIN "
+                                        f"ON *.* TO '{replication_user}'@'%'")
 
         # Change permissions for the root user
         logging.debug("Set permissions for the root user")
@@ -108,11 +118,108 @@ class Mysql:
         outfile = open("/etc/mysql/conf.d/zz_cluster.cnf", 'w')
         outfile.write("# DO NOT EDIT - This file was generated automatically\n")
         outfile.write("[mysqld]\n")
+        outfile.write(f"datadir={Mysql.mysql_datadir}\n")
         outfile.write(f"server_id={server_id}\n")
         outfile.write("gtid_mode=ON\n")
         outfile.write("enforce-gtid-consistency=ON\n")
+
+        # Clone plugin to copy the data of a running node to a new node
+        outfile.write("plugin-load-add=mysql_clone.so\n")
+
+        # Multi-threaded replication applier, transactions that do not
+        # touch the same rows (writeset) are applied in parallel
+        options = {
+            'slave_parallel_workers': Mysql.get_replication_workers(),
+            'slave_parallel_type': "LOGICAL_CLOCK",
+            'slave_preserve_commit_order': "ON",
+            'binlog_transaction_dependency_tracking': "WRITESET",
+            'transaction_write_set_extraction': "XXHASH64"
+        }
+
+        options.update(Mysql.get_resource_options())
+        options.update(Mysql.get_option_overrides(consul))
+
+        for option, value in options.items():
+            outfile.write(f"{option}={value}\n")
+
         outfile.close()
 
+    @staticmethod
+    def get_replication_workers():
+        """
+        Get the number of replication applier threads (default: number of
+        CPUs, at least 2 and at most 16)
+        """
+        workers = os.getenv('MCM_REPLICATION_WORKERS')
+
+        if workers is not None:
+            return int(workers)
+
+        return min(max(Resources.get_cpus(), 2), 16)
+
+    @staticmethod
+    def get_resource_options():
+        """
+        Get the InnoDB, thread and connection options for the CPUs,
+        the memory and the disk of the container
+        """
+        cpus = Resources.get_cpus()
+        memory = Resources.get_memory()
+        disk_class = Resources.get_disk_class(Mysql.mysql_datadir)
+
+        logging.info("Resources for MySQL (cpus=%i, memory=%i MiB, disk=%s)",
+                     cpus, memory // (1024 * 1024), disk_class)
+
+        mib = 1024 * 1024
+        gib = 1024 * mib
+
+        # Keep memory for the connections, xtrabackup, and the cluster manager
+        buffer_pool_share = 0.5 if memory < 4 * gib else 0.7
+        buffer_pool_size = max(int(memory * buffer_pool_share) // (128 * mib), 1) * 128 * mib
+
+        # The redo log (two files) is a quarter of the buffer pool
+        log_file_size = min(max(buffer_pool_size // 8, 48 * mib), 2 * gib) // mib * mib
+
+        io_capacity, io_capacity_max = {
+            'nvme': (10000, 20000),
+            'ssd': (2000, 4000),
+            'hdd': (200, 2000)
+        }.get(disk_class, (2000, 4000))
+
+        io_threads = min(max(cpus, 4), 32)
+        max_connections = min(max((memory - buffer_pool_size) // (8 * mib), 151), 4000)
+
+        return {
+            'innodb_buffer_pool_size': buffer_pool_size,
+            'innodb_buffer_pool_instances': min(max(buffer_pool_size // gib, 1), 8),
+            'innodb_log_file_size': log_file_size,
+            'innodb_io_capacity': io_capacity,
+            'innodb_io_capacity_max': io_capacity_max,
+            'innodb_flush_neighbors': 1 if disk_class == "hdd" else 0,
+            'innodb_read_io_threads': io_threads,
+            'innodb_write_io_threads': io_threads,
+            'max_connections': max_connections,
+            'thread_cache_size': min(16 * cpus, max_connections)
+        }
+
+    @staticmethod
+    def get_option_overrides(consul):
+        """
+        Get the MySQL options set in Consul (mcm/mysql_config/<option>) and
+        in the environment (MCM_MYSQL_OPTION_<OPTION>). The environment of
+        the container takes precedence over the cluster wide settings.
+        """
+        overrides = consul.get_mysql_options()
+
+        for name, value in os.environ.items():
+            if name.startswith("MCM_MYSQL_OPTION_"):
+                overrides[name[len("MCM_MYSQL_OPTION_"):].lower()] = value
+
+        for option, value in overrides.items():
+            logging.info("Using MySQL option override %s=%s", option, value)
+
+        return overrides
+
     @staticmethod
     def change_to_replication_client(leader_ip):
         """
@@ -142,9 +249,11 @@ class Mysql:
     @staticmethod
     def delete_replication_config():
         """
-        Stop the replication
+        Stop the replication. The retrieved transactions are applied
+        first, RESET SLAVE ALL removes the relay log.
         """
         logging.debug("Removing old replication configuraion")
+        Mysql.apply_retrieved_transactions()
         Mysql.execute_query_as_root("STOP SLAVE", discard_result=True)
         Mysql.execute_query_as_root("RESET SLAVE ALL", discard_result=True)
 
@@ -153,6 +262,43 @@ class Mysql:
         Mysql.execute_query_as_root("SET GLOBAL super_read_only = 0", discard_result=True)
         Mysql.execute_query_as_root("SET GLOBAL read_only = 0", discard_result=True)
 
+    @staticmethod
+    def apply_retrieved_transactions():
+        """
+        Stop the receiver thread and wait until the SQL thread has applied
+        all retrieved transactions (at most MCM_PROMOTION_APPLY_TIMEOUT
+        seconds). Returns False if transactions are not applied.
+        """
+        slave_status = Mysql.execute_query_as_root("SHOW SLAVE STATUS")
+
+        if len(slave_status) != 1:
+            return True
+
+        Mysql.execute_query_as_root("STOP SLAVE IO_THREAD", discard_result=True)
+
+        retrieved_gtid_set = slave_status[0].get('Retrieved_Gtid_Set', "").replace("\n", "")
+
+        if not retrieved_gtid_set:
+            return True
+
+        if slave_status[0].get('Slave_SQL_Running') != "Yes":
+            logging.error("SQL thread is not running, retrieved transactions %s may not be applied",
+                          retrieved_gtid_set)
+            return False
+
+        timeout = int(os.getenv('MCM_PROMOTION_APPLY_TIMEOUT', "120"))
+        logging.info("Applying retrieved transactions %s (timeout=%is)", retrieved_gtid_set, timeout)
+
+        result = Mysql.execute_query_as_root(f"SELECT WAIT_FOR_EXECUTED_GTID_SET('{retrieved_gtid_set}', "
+                                             f"{timeout}) AS result")
+
+        if result[0]['result'] != 0:
+            logging.error("Retrieved transactions not applied after %i seconds, "
+                          "unapplied transactions are lost", timeout)
+            return False
+
+        return True
+
     @staticmethod
     def get_replication_leader_ip():
         """
@@ -169,6 +315,41 @@ class Mysql:
 
         return slave_status[0]['Master_Host']
 
+    @staticmethod
+    def get_node_status():
+        """
+        Get the replication status and the load of the node. The
+        replication lag is None if this is not a replication follower
+        or the SQL thread is stopped.
+        """
+        slave_status = Mysql.execute_query_as_root("SHOW SLAVE STATUS")
+        global_status = Mysql.execute_query_as_root("SHOW GLOBAL STATUS LIKE 'Threads_running'")
+        gtid_executed = Mysql.execute_query_as_root("SELECT @@GLOBAL.gtid_executed")[0]['@@GLOBAL.gtid_executed']
+
+        node_status = {
+            'replication_lag': None,
+            'replication_running': False,
+            'threads_running': int(global_status[0]['Value']) if global_status else 0,
+            'gtid_executed': gtid_executed.replace("\n", ""),
+            'retrieved_gtid_set': ""
+        }
+
+        if len(slave_status) == 1:
+            node_status['replication_lag'] = slave_status[0].get('Seconds_Behind_Master')
+            node_status['replication_running'] = slave_status[0].get('Slave_IO_Running') == "Yes" \
+                and slave_status[0].get('Slave_SQL_Running') == "Yes"
+            node_status['retrieved_gtid_set'] = slave_status[0].get('Retrieved_Gtid_Set', "").replace("\n", "")
+
+        return node_status
+
+    @staticmethod
+    def is_gtid_subset(subset, superset):
+        """
+        Are all transactions of the first GTID set contained in the second set?
+        """
+        result = Mysql.execute_query_as_root(f"SELECT GTID_SUBSET('{subset}', '{superset}') AS subset")
+        return result[0]['subset'] == 1
+
     @staticmethod
     def is_repliation_data_processed():
         """
@@ -203,16 +384,18 @@ class Mysql:
         return True
 
     @staticmethod
-    def server_start(use_root_password=True):
+    def server_start(use_root_password=True, exit_on_error=True, timeout=120, options=()):
         """
         Start the MySQL server and wait for ready to serve connections.
+        Without exit_on_error, None is returned if the server does not start.
+        The options are passed to the server (e.g., --skip-slave-start).
         """
 
         logging.info("Starting MySQL")
 
         Mysql.build_configuration()
 
-        mysql_server = [Mysql.mysql_server_binary, "--user=mysql"]
+        mysql_server = [Mysql.mysql_server_binary, "--user=mysql"] + list(options)
         mysql_process = subprocess.Popen(mysql_server)
 
         # Use root password for the connection or not
@@ -220,7 +403,12 @@ class Mysql:
         if use_root_password:
             root_password = os.environ.get("MYSQL_ROOT_PASSWORD")
 
-        Mysql.wait_for_connection(password=root_password)
+        if not Mysql.wait_for_connection(timeout=timeout, password=root_password,
+                                         exit_on_error=exit_on_error):
+            mysql_process.kill()
+            mysql_process.wait()
+            subprocess.run(["/usr/bin/pkill", "-KILL", "-x", "mysqld"], check=False)
+            return None
 
         return mysql_process
 
@@ -247,28 +435,14 @@ class Mysql:
 
         root_password = os.environ.get("MYSQL_ROOT_PASSWORD")
 
-        cnx = None
-
-        try:
-            cnx = mysql.connector.connect(user='root', password=root_password,
-                                          database=database,
-                                          unix_socket='/var/run/mysqld/mysqld.sock')
-
+        pool = ConnectionPool.get_pool(username='root', password=root_password,
+                                       database=database)
 
-            cur = cnx.cursor(dictionary=True, buffered=True)
-            cur.execute(sql)
-
-            if discard_result:
-                return None
-
-            return cur.fetchall()
-        finally:
-            if cnx:
-                cnx.close()
+        return pool.execute(sql, fetch_result=not discard_result)
 
     @staticmethod
     def wait_for_connection(timeout=120, username='root',
-                            password=None, database='mysql'):
+                            password=None, database='mysql', exit_on_error=True):
 
         """
         Test connection via unix-socket. During first init
@@ -292,7 +466,9 @@ class Mysql:
 
         logging.error("Unable to connect to MySQL (timeout=%i). %s",
                       elapsed_time, last_error)
-        sys.exit(1)
+
+        if exit_on_error:
+            sys.exit(1)
 
         return False
 
@@ -317,20 +493,9 @@ class Mysql:
         Execute the given SQL statement.
         """
         try:
-            if port is None:
-                cnx = mysql.connector.connect(user=username, password=password,
-                                              database=database,
-                                              unix_socket='/var/run/mysqld/mysqld.sock')
-
-            else:
-                cnx = mysql.connector.connect(user=username, password=password,
-                                              database=database, port=port)
-
-            cursor = cnx.cursor()
-
-            cursor.execute(sql)
-
-            cnx.close()
+            pool = ConnectionPool.get_pool(username=username, password=password,
+                                           database=database, port=port)
+            pool.execute(sql)
             return True
         except mysql.connector.Error as err:
             if log_error:
@@ -340,147 +505,305 @@ class Mysql:
     @staticmethod
     def backup_data():
         """
-        Backup the local MySQL Server and upload
-        the backup into a S3 bucket.
+        Backup the local MySQL Server and stream the backup
+        into a S3 bucket. The backup is not staged on the local disk.
+
+        Depending on the existing backups, a full or an incremental
+        backup (based on the LSN of the last backup) is created.
         """
 
         # Call Setup to ensure bucket and policies do exist
         Minio.setup_connection()
 
-        # Backup directory
+        codec = Codec.get_configured_codec()
         current_time = time.time()
+
+        server_uuid = Mysql.execute_query_as_root("SELECT @@GLOBAL.server_uuid")[0]['@@GLOBAL.server_uuid']
+        parent = Mysql.get_incremental_backup_parent(server_uuid)
+
+        if parent is None:
+            backup_name = f"mysql_backup_{current_time}.xbstream.{codec.extension}"
+            incremental_lsn = None
+        else:
+            backup_name = f"mysql_backup_{current_time}_incremental.xbstream.{codec.extension}"
+            incremental_lsn = parent['to_lsn']
+
+        # Directory for the temporary files and the checkpoints of xtrabackup
         backup_dir = f"/tmp/mysql_backup_{current_time}"
-        backup_folder_name = "mysql"
-        backup_dest = f"{backup_dir}/{backup_folder_name}"
 
-        logging.info("Backing up MySQL into dir %s", backup_dest)
         if os.path.exists(backup_dir):
-            logging.error("Backup path %s already exists, skipping backup run", backup_dest)
+            logging.error("Backup path %s already exists, skipping backup run", backup_dir)
+            return False
 
-        # Crate backup dir
         os.makedirs(backup_dir)
 
-        # Create mysql backup
-        backup_user = os.environ.get("MYSQL_BACKUP_USER")
-        backup_password = os.environ.get("MYSQL_BACKUP_PASSWORD")
-        xtrabackup = [Mysql.xtrabackup_binary, f"--user={backup_user}",
-                      f"--password={backup_password}", "--backup",
-                      f"--target-dir={backup_dest}"]
+        logging.info("Streaming MySQL backup into object %s (incremental_lsn=%s)",
+                     backup_name, incremental_lsn)
+
+        # Create mysql backup (xtrabackup | compress | upload) with a low priority
+        xtrabackup = Xtrabackup.get_backup_command(backup_dir, incremental_lsn) \
+            + BackupThrottle.get_throttle_option()
+        compress = codec.get_compress_command(level=Codec.get_configured_level(),
+                                              threads=Codec.get_configured_threads())
+
+        # The compressed backup is not larger than the datadir (determines the part size)
+        expected_size = Utils.get_directory_size(Mysql.mysql_datadir)
+        start_time = time.time()
+
+        xtrabackup_process = subprocess.Popen(BackupThrottle.get_priority_command(xtrabackup),
+                                              stdout=subprocess.PIPE)
+        compress_process = subprocess.Popen(BackupThrottle.get_priority_command(compress),
+                                            stdin=xtrabackup_process.stdout,
+                                            stdout=subprocess.PIPE)
+        xtrabackup_process.stdout.close()
+
+        # Pause the backup while the server is overloaded
+        throttle = BackupThrottle(xtrabackup_process, Mysql.execute_query_as_root)
+        throttle.start()
+
+        # Upload the compressed stream, count the transferred bytes and build the checksum
+        checksum = hashlib.sha256()
+        backup_stream = MeteredStream(compress_process.stdout, checksum)
+        upload_result = Minio.upload_stream(backup_name, backup_stream, {"mcm-codec": codec.name},
+                                            expected_size)
+        paused_seconds = throttle.stop()
+
+        if not upload_result:
+            xtrabackup_process.kill()
+            compress_process.kill()
+
+        compress_process.stdout.close()
+        return_codes = [xtrabackup_process.wait(), compress_process.wait()]
+        backup_size = backup_stream.read_bytes
+        duration = time.time() - start_time
+
+        checkpoints = Xtrabackup.read_checkpoints(backup_dir)
+        binlog_info = Xtrabackup.read_binlog_info(backup_dir)
+
+        # Remove temporary files
+        rmtree(backup_dir)
+
+        if any(return_codes) or not upload_result or checkpoints is None or binlog_info is None:
+            logging.error("Backup failed, return codes (xtrabackup, %s) are %s, upload=%s",
+                          codec.name, return_codes, upload_result)
+            Minio.remove_object(backup_name)
+            Metrics.backups.labels("failure").inc()
+            return False
 
-        subprocess.run(xtrabackup, check=True)
+        # Record the position of the backup in the backup chain
+        record = {
+            'name': backup_name,
+            'type': 'full' if parent is None else 'incremental',
+            'base': backup_name if parent is None else parent['base'],
+            'parent': None if parent is None else parent['name'],
+            'chain_position': 0 if parent is None else parent['chain_position'] + 1,
+            'from_lsn': checkpoints['from_lsn'],
+            'to_lsn': checkpoints['to_lsn'],
+            'server_uuid': server_uuid,
+            'ip_address': Utils.get_local_ip_address(),
+            'replica': Mysql.get_replication_leader_ip() is not None,
+            'binlog_file': binlog_info['binlog_file'],
+            'binlog_position': binlog_info['binlog_position'],
+            'gtid_executed': binlog_info['gtid_executed'],
+            'codec': codec.name,
+            'size': backup_size,
+            'checksum': f"sha256:{checksum.hexdigest()}",
+            'timestamp': current_time
+        }
+
+        if not Minio.write_chain_record(record):
+            logging.error("Unable to store chain record of backup %s", backup_name)
+            Minio.remove_object(backup_name)
+            Metrics.backups.labels("failure").inc()
+            return False
 
-        # Prepare backup
-        xtrabackup_prepare = [Mysql.xtrabackup_binary, "--prepare",
-                              f"--target-dir={backup_dest}"]
+        # Publish the backup in the catalog
+        BackupCatalog.add_backup(record)
 
-        subprocess.run(xtrabackup_prepare, check=True)
+        throughput = backup_size / max(duration, 0.001) / (1024 * 1024)
+        logging.info("Backup was successfully created (object=%s, type=%s, codec=%s, bytes=%i, "
+                     "duration=%.1fs, paused=%.1fs, throughput=%.2f MiB/s)",
+                     backup_name, record['type'], codec.name, backup_size, duration,
+                     paused_seconds, throughput)
 
-        # Compress backup (structure in tar mysql/*)
-        backup_file = f"/tmp/mysql_backup_{current_time}.tgz"
-        tar = ["/bin/tar", "zcf", backup_file, "-C", backup_dir, backup_folder_name]
-        subprocess.run(tar, check=True)
+        Metrics.backups.labels("success").inc()
+        Metrics.backup_duration.labels(record['type']).observe(duration)
+        Metrics.backup_bytes.labels(record['type']).inc(backup_size)
+        Metrics.backup_throughput.set(backup_size / max(duration, 0.001))
 
-        # Upload Backup to S3 Bucket
-        mc_args = [Minio.minio_binary, "cp", backup_file, "backup/mysqlbackup/"]
-        subprocess.run(mc_args, check=True)
+        return True
 
-        # Remove old backup data
-        rmtree(backup_dir)
-        os.remove(backup_file)
+    @staticmethod
+    def get_incremental_backup_parent(server_uuid):
+        """
+        Get the chain record of the backup the next incremental backup
+        is based on. None is returned, if a full backup is needed.
+        """
+        max_incrementals = int(os.getenv('MCM_BACKUP_MAX_INCREMENTALS', "6"))
+
+        if max_incrementals <= 0:
+            return None
+
+        record = BackupCatalog.get_latest_backup()
+
+        if record is None:
+            return None
+
+        if 'to_lsn' not in record:
+            logging.info("Latest backup %s has no LSN information, creating full backup",
+                         record['name'])
+            return None
+
+        # LSNs are only valid on the server that has created the backup
+        if record['server_uuid'] != server_uuid:
+            logging.info("Latest backup was created on %s, creating full backup",
+                         record['server_uuid'])
+            return None
+
+        # Backups based on a corrupt backup can not be restored
+        if not BackupCatalog.is_restorable(record, Consul.get_instance().get_backup_records()):
+            logging.info("Backup chain of %s contains a corrupt backup, creating full backup",
+                         record['name'])
+            return None
+
+        if record['chain_position'] >= max_incrementals:
+            logging.info("Backup chain contains %i incremental backups, creating full backup",
+                         record['chain_position'])
+            return None
 
-        logging.info("Backup was successfully created")
+        return record
 
     @staticmethod
-    def create_backup_if_needed(maxage_seconds=60*60*6):
+    def create_backup_if_needed(maxage_seconds=60*60*6, background=True):
         """
         Create a new backup if needed. Default age is 6h
         """
         logging.debug("Checking for backups")
 
-        consul_client = Consul.get_instance()
-        if not consul_client.is_replication_leader():
-            logging.debug("We are not the replication master, skipping backup check")
+        backup_name = None
+        backup_date = None
+        record = BackupCatalog.get_latest_backup()
+
+        if record is not None:
+            backup_name = record['name']
+            backup_date = datetime.fromtimestamp(record['timestamp'])
+
+        if not Utils.is_refresh_needed(backup_date, timedelta(seconds=maxage_seconds)):
             return False
 
-        backup_name, backup_date = Minio.get_latest_backup()
+        backup_node = Mysql.get_backup_node(record)
 
-        if Utils.is_refresh_needed(backup_date, timedelta(seconds=maxage_seconds)):
-            logging.info("Old backup is outdated (%s, %s), creating new one",
-                         backup_name, backup_date)
+        if backup_node != Utils.get_local_ip_address():
+            logging.debug("Backup is created by %s, skipping backup", backup_node)
+            return False
 
-            # Perform backup in extra thread to prevent Consul loop interruption
-            backup_thread = threading.Thread(target=Mysql.backup_data)
-            backup_thread.start()
+        if not Consul.get_instance().try_to_acquire_backup_lock():
+            logging.info("Backup lock is held by another node, skipping backup")
+            return False
 
-            return True
+        logging.info("Old backup is outdated (%s, %s), creating new one",
+                     backup_name, backup_date)
 
-        return False
+        if not background:
+            return Mysql.backup_data_with_lock()
+
+        # Perform backup in extra thread to prevent Consul loop interruption
+        backup_thread = threading.Thread(target=Mysql.backup_data_with_lock)
+        backup_thread.start()
+
+        return True
 
     @staticmethod
-    def restore_backup():
+    def backup_data_with_lock():
         """
-        Restore the latest MySQL dump from the S3 Bucket
+        Create a backup and release the backup lock afterwards
         """
-        logging.info("Restore MySQL Backup")
-        current_time = time.time()
+        try:
+            return Mysql.backup_data()
+        finally:
+            Consul.get_instance().release_backup_lock()
 
-        if os.path.isfile(f"{Mysql.mysql_datadir}/ib_logfile0"):
-            logging.info("MySQL is already initialized, cleaning up first")
-            old_mysql_dir = f"{Mysql.mysql_datadir}_old_{current_time}"
+    @staticmethod
+    def get_backup_node(latest_backup):
+        """
+        Get the IP of the node that should create the next backup. Backups
+        are created on a running follower with a replication lag of at
+        most MCM_BACKUP_MAX_REPLICATION_LAG seconds. The follower that has
+        created the latest backup is preferred, so the backup chain can
+        be continued with incremental backups. The replication leader is
+        only used if no follower qualifies.
+        """
+        consul = Consul.get_instance()
+        leader_ip = consul.get_replication_leader_ip()
+        max_lag = float(os.getenv('MCM_BACKUP_MAX_REPLICATION_LAG', "60"))
+
+        replicas = [node_record for node_record in consul.get_all_registered_node_records()
+                    if node_record['ip_address'] != leader_ip
+                    and node_record.get('replication_running')
+                    and node_record.get('replication_lag') is not None
+                    and node_record['replication_lag'] <= max_lag]
 
-            os.mkdir(old_mysql_dir, 0o700)
+        if not replicas:
+            return leader_ip
 
-            # Renaming file per file, on some docker images
-            # the complete directory can not be moved
-            for entry in os.listdir(Mysql.mysql_datadir):
-                source_name = f"{Mysql.mysql_datadir}/{entry}"
-                dest_name = f"{old_mysql_dir}/{entry}"
-                logging.debug("Moving %s to %s", source_name, dest_name)
-                shutil.move(source_name, dest_name)
+        replica_ips = [node_record['ip_address'] for node_record in replicas]
 
-            logging.info("Old MySQL data moved to: %s", old_mysql_dir)
+        if latest_backup is not None and latest_backup.get('ip_address') in replica_ips:
+            return latest_backup['ip_address']
 
+        return min(replicas, key=lambda node_record: (node_record['replication_lag'],
+                                                      node_record['ip_address']))['ip_address']
+
+    @staticmethod
+    def restore_backup(latest_backup=None):
+        """
+        Restore the given MySQL dump from the S3 Bucket. By default, the
+        latest verified backup (or the latest backup that is not known
+        to be corrupt) is restored.
+        """
+        logging.info("Restore MySQL Backup")
 
-        backup_file, _ = Minio.get_latest_backup()
+        if latest_backup is None:
+            latest_backup = BackupCatalog.get_restore_backup()
 
-        if backup_file is None:
+        if latest_backup is None:
             logging.error("Unable to restore backup, no backup found in bucket")
             return False
 
-        # Restore directory
-        restore_dir = f"/tmp/mysql_restore_{current_time}"
+        # Restore into a staging directory, the datadir is replaced at the end
+        restore_dir = Staging.create(Mysql.mysql_datadir)
 
-        # Crate restore dir
-        os.makedirs(restore_dir)
+        backup_file = latest_backup['name']
+        backup_chain = BackupRestore.get_backup_chain(backup_file)
 
-        # Download backup
-        mc_download = [Minio.minio_binary, "cp", f"backup/mysqlbackup/{backup_file}",
-                       restore_dir]
-        subprocess.run(mc_download, check=True)
+        if backup_chain is None:
+            logging.error("Unable to determine the backup chain of %s", backup_file)
+            return False
 
-        # Unpack backup
-        tar = ["/bin/tar", "zxf", f"{restore_dir}/{backup_file}", "-C", restore_dir]
-        subprocess.run(tar, check=True)
+        start_time = time.time()
+        phase_durations = BackupRestore.restore_backup_chain(backup_chain, restore_dir)
 
-        # Ensure that this is a MySQL Backup
-        if not os.path.isfile(f"{restore_dir}/mysql/ib_logfile0"):
-            logging.error("Unpacked backup is not a MySQL backup")
-            rmtree(restore_dir)
+        if phase_durations is None:
             return False
 
-        # Restore backup
-        xtrabackup = [Mysql.xtrabackup_binary, "--copy-back",
-                      f"--target-dir={restore_dir}/mysql"]
-        subprocess.run(xtrabackup, check=True)
+        for phase, duration in phase_durations.items():
+            Mysql.record_restore_phase(phase, duration)
 
-        # Change permissions of the restored data
-        chown = ['chown', 'mysql.mysql', '-R', '/var/lib/mysql/']
-        subprocess.run(chown, check=True)
+        Staging.swap(Mysql.mysql_datadir, restore_dir)
+
+        logging.info("Backup %s was successfully restored (incremental backups=%i, "
+                     "duration=%.1fs)", backup_file, len(backup_chain) - 1,
+                     time.time() - start_time)
 
-        # Remove old backup data
-        rmtree(restore_dir)
         return True
 
+    @staticmethod
+    def record_restore_phase(phase, duration):
+        """
+        Log and export the duration of a restore phase
+        """
+        logging.info("Restore phase %s finished (duration=%.1fs)", phase, duration)
+        Metrics.restore_phase_duration.labels(phase).set(duration)
 
     @staticmethod
     def restore_backup_or_exit():
@@ -1,9 +1,12 @@
 """This file contains the ProxySQL related actions"""
 
 import os
+import time
 import logging
 import subprocess
 
+from mcm.connection import ConnectionPool
+from mcm.metrics import Metrics
 from mcm.mysql import Mysql
 
 class Proxysql:
@@ -11,12 +14,25 @@ class Proxysql:
     This class encapsulates all ProxySQL related things
     """
 
+    # Hostgroups of the replication leader and the followers
+    writer_hostgroup = 1
+    reader_hostgroup = 2
+
+    # Port of the backend MySQL servers
+    mysql_port = 3306
+
     def __init__(self):
         """
         Init the instance
         """
         self.configured_mysql_hosts = ()
 
+        # Time of the last backend change that is not saved to disk
+        self.last_change_time = None
+
+        # Followers drained from the reader hostgroup
+        self.drained_mysql_hosts = set()
+
 
     @staticmethod
     def inital_setup():
@@ -72,36 +88,222 @@ class Proxysql:
         Proxysql.perform_sql_query("SAVE MYSQL QUERY RULES TO DISK")
 
     @staticmethod
-    def set_mysql_server(mysql_servers):
+    def get_mysql_servers(table="mysql_servers"):
         """
-        Set the backend MySQL server
+        Get the backend MySQL servers of the table (mysql_servers or
+        runtime_mysql_servers), the key is the tuple (hostgroup, hostname, port)
         """
-        logging.info("Removing all old backend MySQL Server")
-        Proxysql.perform_sql_query("DELETE FROM mysql_servers")
+        result = Proxysql.get_connection_pool().execute(
+            "SELECT hostgroup_id, hostname, port, status, weight, max_replication_lag "
+            f"FROM {table}", fetch_result=True)
 
-        for mysql_server in mysql_servers:
-            logging.info("Adding %s as backend MySQL Server", mysql_server)
-            Proxysql.perform_sql_query("INSERT INTO mysql_servers(hostgroup_id, hostname, port) "
-                                       f"VALUES (1, '{mysql_server}', 3306)")
+        return {(int(row['hostgroup_id']), row['hostname'], int(row['port'])): {
+            'status': row['status'],
+            'weight': int(row['weight']),
+            'max_replication_lag': int(row['max_replication_lag'])} for row in result}
 
-        Proxysql.perform_sql_query("LOAD MYSQL SERVERS TO RUNTIME")
-        Proxysql.perform_sql_query("SAVE MYSQL SERVERS TO DISK")
+    @staticmethod
+    def get_max_replication_lag():
+        """
+        Get the maximal replication lag of a follower in the reader hostgroup
+        """
+        return int(os.getenv('MCM_PROXYSQL_MAX_REPLICATION_LAG', "10"))
 
-    def update_mysql_server_if_needed(self, current_mysql_servers):
+    @staticmethod
+    def get_reader_weight(node_record):
+        """
+        Get the weight of a follower in the reader hostgroup. The
+        weight decreases with the replication lag and the load.
+        """
+        replication_lag = node_record.get('replication_lag') or 0
+        threads_running = node_record.get('threads_running') or 0
+        weight = 1000 / (1 + replication_lag) / (1 + threads_running / 16)
+
+        return max(int(weight), 1)
+
+    def is_drained(self, node_record):
         """
-        Update the MySQL-Servers if needed (changed)
+        Is the follower drained from the reader hostgroup? Followers with
+        a stopped replication or a lag above the maximum are drained. They
+        return when the lag is below the half of the maximum.
         """
-        current_mysql_servers.sort()
+        ip_address = node_record['ip_address']
+
+        # Nodes without published replication status
+        if 'replication_lag' not in node_record:
+            return False
+
+        replication_lag = node_record['replication_lag']
+        max_replication_lag = Proxysql.get_max_replication_lag()
+
+        if replication_lag is None or not node_record.get('replication_running'):
+            drained = True
+        elif ip_address in self.drained_mysql_hosts:
+            drained = replication_lag > max_replication_lag / 2
+        else:
+            drained = replication_lag > max_replication_lag
+
+        if drained and ip_address not in self.drained_mysql_hosts:
+            logging.info("Draining %s from the readers (lag=%s, running=%s)", ip_address,
+                         replication_lag, node_record.get('replication_running'))
+            self.drained_mysql_hosts.add(ip_address)
+        elif not drained and ip_address in self.drained_mysql_hosts:
+            logging.info("Adding %s to the readers again (lag=%s)", ip_address, replication_lag)
+            self.drained_mysql_hosts.remove(ip_address)
+
+        return drained
+
+    def get_backend_configuration(self, node_records, leader_ip):
+        """
+        Get the backend MySQL servers for the node records. The replication
+        leader is the writer, the followers are the readers.
+        """
+        mysql_servers = {}
+
+        for node_record in node_records:
+            ip_address = node_record['ip_address']
+
+            if ip_address == leader_ip:
+                mysql_servers[(Proxysql.writer_hostgroup, ip_address, Proxysql.mysql_port)] = {
+                    'status': 'ONLINE', 'weight': 1000, 'max_replication_lag': 0}
+                continue
+
+            mysql_servers[(Proxysql.reader_hostgroup, ip_address, Proxysql.mysql_port)] = {
+                'status': 'OFFLINE_SOFT' if self.is_drained(node_record) else 'ONLINE',
+                'weight': Proxysql.get_reader_weight(node_record),
+                'max_replication_lag': Proxysql.get_max_replication_lag()}
+
+        return mysql_servers
+
+    def set_mysql_server(self, node_records, leader_ip, persist=True):
+        """
+        Set the backend MySQL server. The servers are compared with the
+        servers used at runtime; only the changed servers are written and
+        loaded to runtime, the remaining servers (and their connections)
+        are not touched. Returns True if the backends were changed.
+        """
+        mysql_servers = self.get_backend_configuration(node_records, leader_ip)
+        statements = Proxysql.get_update_statements(mysql_servers, Proxysql.get_mysql_servers())
+
+        if not statements and Proxysql.is_runtime_up_to_date(
+                mysql_servers, Proxysql.get_mysql_servers("runtime_mysql_servers")):
+            return False
+
+        # Loading the servers applies the changes atomically
+        statements.append("LOAD MYSQL SERVERS TO RUNTIME")
+
+        if persist:
+            statements.append("SAVE MYSQL SERVERS TO DISK")
+
+        Proxysql.get_connection_pool().execute_statements(statements)
+
+        return True
 
-        if self.configured_mysql_hosts != current_mysql_servers:
-            logging.info("MySQL backend has changed (old=%s, new=%s), reconfiguring",
-                         self.configured_mysql_hosts, current_mysql_servers)
-            Proxysql.set_mysql_server(current_mysql_servers)
+    @staticmethod
+    def get_update_statements(mysql_servers, configured_mysql_servers):
+        """
+        Get the statements that change the configured servers into the
+        given servers (e.g., after a changed leader or an admin edit)
+        """
+        statements = []
+        added_servers = []
+
+        for (hostgroup, hostname, port), columns in mysql_servers.items():
+            configured_columns = configured_mysql_servers.get((hostgroup, hostname, port))
+
+            if configured_columns is None:
+                added_servers.append(f"({hostgroup}, '{hostname}', {port}, '{columns['status']}', "
+                                     f"{columns['weight']}, {columns['max_replication_lag']})")
+            elif configured_columns != columns:
+                statements.append(f"UPDATE mysql_servers SET status = '{columns['status']}', "
+                                  f"weight = {columns['weight']}, "
+                                  f"max_replication_lag = {columns['max_replication_lag']} "
+                                  f"WHERE hostgroup_id = {hostgroup} AND hostname = '{hostname}' "
+                                  f"AND port = {port}")
+
+        for (hostgroup, hostname, port) in configured_mysql_servers:
+            if (hostgroup, hostname, port) not in mysql_servers:
+                logging.info("Removing %s:%i from hostgroup %i", hostname, port, hostgroup)
+                statements.append(f"DELETE FROM mysql_servers WHERE hostgroup_id = {hostgroup} "
+                                  f"AND hostname = '{hostname}' AND port = {port}")
+
+        if added_servers:
+            logging.info("Adding backend MySQL Server %s", added_servers)
+            statements.append("INSERT INTO mysql_servers(hostgroup_id, hostname, port, status, "
+                              f"weight, max_replication_lag) VALUES {', '.join(added_servers)}")
+
+        return statements
+
+    @staticmethod
+    def is_runtime_up_to_date(mysql_servers, runtime_mysql_servers):
+        """
+        Are the given servers used at runtime? Servers shunned by the
+        monitor are online in the configuration, and the copies of a server
+        in the other hostgroup are managed by the replication hostgroups.
+        """
+        hostnames = {hostname for _, hostname, _ in mysql_servers}
+
+        # Servers of removed nodes
+        if any(hostname not in hostnames for _, hostname, _ in runtime_mysql_servers):
+            return False
+
+        for key, columns in mysql_servers.items():
+            runtime_columns = runtime_mysql_servers.get(key)
+
+            if runtime_columns is None:
+                return False
+
+            if runtime_columns['status'].startswith("SHUNNED"):
+                runtime_columns = {**runtime_columns, 'status': "ONLINE"}
+
+            if runtime_columns != columns:
+                logging.debug("Runtime backend %s differs (runtime=%s, configured=%s)",
+                              key, runtime_columns, columns)
+                return False
+
+        return True
+
+    def update_mysql_server_if_needed(self, node_records, leader_ip):
+        """
+        Update the MySQL-Servers if needed (changed). The configuration
+        is saved to disk once the backends are stable for save_delay seconds.
+        """
+        current_mysql_servers = sorted(node_record['ip_address'] for node_record in node_records)
+
+        if self.set_mysql_server(node_records, leader_ip, persist=False):
+            logging.debug("MySQL backend has changed (old=%s, new=%s, leader=%s), reconfigured",
+                          self.configured_mysql_hosts, current_mysql_servers, leader_ip)
+            Metrics.proxysql_reconfigurations.inc()
             self.configured_mysql_hosts = current_mysql_servers
+            self.last_change_time = time.time()
             return True
 
+        if self.last_change_time is not None and \
+            time.time() - self.last_change_time >= Proxysql.get_save_delay():
+
+            logging.debug("Saving ProxySQL backend configuration to disk")
+            Proxysql.perform_sql_query("SAVE MYSQL SERVERS TO DISK")
+            self.last_change_time = None
+
+        self.configured_mysql_hosts = current_mysql_servers
+
         return False
 
+    @staticmethod
+    def get_save_delay():
+        """
+        Get the delay for saving changed backends to disk
+        """
+        return int(os.getenv('MCM_PROXYSQL_SAVE_DELAY', "60"))
+
+    @staticmethod
+    def get_connection_pool():
+        """
+        Get the connection pool of the ProxySQL admin interface
+        """
+        return ConnectionPool.get_pool(username="admin", password="admin",
+                                       database="", port=6032)
+
     @staticmethod
     def perform_sql_query(sql):
         """
@@ -0,0 +1,136 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import math
+
+
+class Resources:
+    """
+    Detect the resources (CPU, memory, disk) that are available to the
+    container. Limits of the cgroup (v1 and v2) are taken into account.
+    """
+
+    # The mount point of the cgroup filesystem
+    cgroup_root = "/sys/fs/cgroup"
+
+    # cgroup v1 reports 'no memory limit' as a page aligned huge number
+    unlimited_memory = 1 << 60
+
+    @staticmethod
+    def read_file(filename):
+        """
+        Read the first line of the file (None if not readable)
+        """
+        try:
+            with open(filename, "r", encoding="utf-8") as infile:
+                return infile.readline().strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def get_cgroup_cpu_limit():
+        """
+        Get the CPU limit of the cgroup (None if not limited)
+        """
+        # cgroup v2: '<quota> <period>' or 'max <period>'
+        cpu_max = Resources.read_file(f"{Resources.cgroup_root}/cpu.max")
+
+        if cpu_max is not None:
+            quota, period = cpu_max.split()
+
+            if quota == "max":
+                return None
+
+            return int(quota) / int(period)
+
+        # cgroup v1: the quota is -1 if not limited
+        quota = Resources.read_file(f"{Resources.cgroup_root}/cpu/cpu.cfs_quota_us")
+        period = Resources.read_file(f"{Resources.cgroup_root}/cpu/cpu.cfs_period_us")
+
+        if quota is None or period is None or int(quota) <= 0:
+            return None
+
+        return int(quota) / int(period)
+
+    @staticmethod
+    def get_cpus():
+        """
+        Get the number of usable CPUs (rounded up, at least 1)
+        """
+        cpus = len(os.sched_getaffinity(0))
+        cgroup_limit = Resources.get_cgroup_cpu_limit()
+
+        if cgroup_limit is not None:
+            cpus = min(cpus, math.ceil(cgroup_limit))
+
+        return max(cpus, 1)
+
+    @staticmethod
+    def get_cgroup_memory_limit():
+        """
+        Get the memory limit of the cgroup in bytes (None if not limited)
+        """
+        # cgroup v2: a number or 'max'
+        limit = Resources.read_file(f"{Resources.cgroup_root}/memory.max")
+
+        # cgroup v1
+        if limit is None:
+            limit = Resources.read_file(f"{Resources.cgroup_root}/memory/memory.limit_in_bytes")
+
+        if limit is None or limit == "max" or int(limit) >= Resources.unlimited_memory:
+            return None
+
+        return int(limit)
+
+    @staticmethod
+    def get_physical_memory():
+        """
+        Get the physical memory of the host in bytes
+        """
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+    @staticmethod
+    def get_memory():
+        """
+        Get the usable memory in bytes
+        """
+        memory = Resources.get_physical_memory()
+        cgroup_limit = Resources.get_cgroup_memory_limit()
+
+        if cgroup_limit is not None:
+            memory = min(memory, cgroup_limit)
+
+        return memory
+
+    @staticmethod
+    def get_disk_class(path):
+        """
+        Get the class of the disk that stores the path (nvme, ssd or hdd).
+        The class can be set with MCM_DISK_CLASS (e.g., for network
+        storage, which is reported as non-rotational).
+        """
+        disk_class = os.getenv('MCM_DISK_CLASS')
+
+        if disk_class is not None:
+            return disk_class
+
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+
+        device = os.stat(path).st_dev
+        device_path = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+        device_name = os.path.basename(os.path.realpath(device_path))
+
+        # Partitions have no queue, the queue belongs to the parent device
+        rotational = Resources.read_file(f"{device_path}/queue/rotational")
+        if rotational is None:
+            rotational = Resources.read_file(f"{device_path}/../queue/rotational")
+
+        if device_name.startswith("nvme"):
+            return "nvme"
+
+        # Unknown devices (e.g., overlay filesystems) are handled as SSD
+        if rotational == "1":
+            return "hdd"
+
+        return "ssd"
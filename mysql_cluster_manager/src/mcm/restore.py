@@ -0,0 +1,201 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import shutil
+import logging
+import subprocess
+
+from shutil import rmtree
+
+from mcm.cache import BackupCache, CacheWriter
+from mcm.catalog import BackupCatalog
+from mcm.codec import Codec
+from mcm.minio import Minio
+from mcm.throttle import BackupThrottle
+from mcm.utils import Utils
+from mcm.xtrabackup import Xtrabackup
+
+class BackupRestore:
+    """
+    Restore a backup chain (a full backup and the incremental backups
+    based on it) from the S3 bucket into a directory
+    """
+
+    @staticmethod
+    def restore_backup_chain(backup_chain, restore_dir, low_priority=False):
+        """
+        Stream the full backup of the chain into the directory, prepare it
+        and apply the incremental backups. Returns the durations of the
+        restore phases (None on error). With low_priority (e.g., next to
+        the running server), all processes run with a low CPU and I/O
+        priority, and xtrabackup uses one thread and little memory.
+        """
+        current_time = time.time()
+        phase_durations = {}
+
+        def run_prepare(command):
+            if low_priority:
+                command = BackupThrottle.get_priority_command(command)
+
+            return subprocess.run(Utils.run_as_user("mysql", command), check=False).returncode == 0
+
+        full_backup = backup_chain[0]
+        incremental_backups = backup_chain[1:]
+
+        # Stream the full backup directly into the restore directory
+        if not BackupRestore.stream_backup_into_directory(full_backup, restore_dir, low_priority):
+            return None
+
+        phase_durations['download'] = time.time() - current_time
+        phase_start_time = time.time()
+
+        # Streamed backups are not prepared
+        if ".xbstream." in full_backup['name']:
+            xtrabackup_prepare = Xtrabackup.get_prepare_command(
+                restore_dir, apply_log_only=bool(incremental_backups),
+                low_priority=low_priority)
+
+            if not run_prepare(xtrabackup_prepare):
+                logging.error("Unable to prepare backup %s", full_backup['name'])
+                return None
+
+        phase_durations['prepare'] = time.time() - phase_start_time
+        phase_start_time = time.time()
+
+        # Apply the incremental backups, all but the last with apply-log-only
+        for position, incremental_backup in enumerate(incremental_backups):
+            incremental_dir = f"/tmp/mysql_incremental_{current_time}_{position}"
+            os.makedirs(incremental_dir)
+
+            download_start_time = time.time()
+            if not BackupRestore.stream_backup_into_directory(incremental_backup, incremental_dir,
+                                                      low_priority):
+                rmtree(incremental_dir)
+                return None
+
+            prepare_start_time = time.time()
+            apply_log_only = position < len(incremental_backups) - 1
+            xtrabackup_prepare = Xtrabackup.get_prepare_command(
+                restore_dir, incremental_dir=incremental_dir,
+                apply_log_only=apply_log_only, low_priority=low_priority)
+            prepare_result = run_prepare(xtrabackup_prepare)
+            rmtree(incremental_dir)
+
+            if not prepare_result:
+                logging.error("Unable to apply incremental backup %s", incremental_backup['name'])
+                return None
+
+            logging.info("Incremental backup %s applied (download=%.1fs, prepare=%.1fs)",
+                         incremental_backup['name'], prepare_start_time - download_start_time,
+                         time.time() - prepare_start_time)
+
+        phase_durations['incremental'] = time.time() - phase_start_time
+        phase_durations['total'] = time.time() - current_time
+
+        # Ensure that this is a MySQL Backup
+        if not os.path.isfile(f"{restore_dir}/ib_logfile0"):
+            logging.error("Restored backup is not a MySQL backup")
+            return None
+
+        return phase_durations
+
+    @staticmethod
+    def get_backup_chain(backup_file):
+        """
+        Get the chain records from the full backup up to the given backup
+        """
+        backup_chain = []
+        backup_name = backup_file
+
+        while backup_name is not None:
+            record = BackupCatalog.get_backup(backup_name)
+
+            if record is None:
+                # Incremental backups without a chain record can not be applied
+                if "_incremental." in backup_name:
+                    logging.error("Chain record of backup %s not found", backup_name)
+                    return None
+
+                # Backup created before backup chains were introduced
+                record = {'name': backup_name, 'type': 'full', 'parent': None}
+
+            backup_chain.insert(0, record)
+            backup_name = record['parent']
+
+        return backup_chain
+
+    @staticmethod
+    def stream_backup_into_directory(backup_record, target_dir, low_priority=False):
+        """
+        Download, decompress and unpack the backup in one pipeline. The
+        unpacking is performed as mysql user, so no chown is needed. With
+        low_priority, decompress and unpack run with a low CPU and I/O
+        priority.
+        """
+        backup_file = backup_record['name']
+        logging.info("Streaming backup %s into %s", backup_file, target_dir)
+
+        # The unpack process needs to be able to write into the directory
+        if os.geteuid() == 0:
+            shutil.chown(target_dir, "mysql", "mysql")
+
+        if 'codec' in backup_record:
+            codec = Codec.get_codec(backup_record['codec'])
+        else:
+            codec = Codec.get_codec_for_object(backup_file,
+                                               Minio.get_object_metadata(backup_file))
+
+        if ".xbstream." in backup_file:
+            unpack = Xtrabackup.get_unpack_command(target_dir, low_priority)
+        else:
+            # Legacy backups contain the prepared datadir as mysql/*
+            unpack = ["/bin/tar", "xf", "-", "-C", target_dir,
+                      "--strip-components=1"]
+
+        decompress = codec.get_decompress_command()
+
+        if low_priority:
+            decompress = BackupThrottle.get_priority_command(decompress)
+            unpack = BackupThrottle.get_priority_command(unpack)
+
+        # Use the local copy of the backup, if available
+        cached_file = BackupCache.get_cached_file(backup_record)
+
+        if cached_file is not None:
+            logging.info("Using cached backup %s", cached_file)
+            with open(cached_file, "rb") as backup_stream:
+                decompress_process = subprocess.Popen(decompress, stdin=backup_stream,
+                                                      stdout=subprocess.PIPE)
+        else:
+            decompress_process = subprocess.Popen(decompress, stdin=subprocess.PIPE,
+                                                  stdout=subprocess.PIPE)
+
+        # (download | cache) | decompress | unpack
+        unpack_process = subprocess.Popen(Utils.run_as_user("mysql", unpack),
+                                          stdin=decompress_process.stdout)
+        decompress_process.stdout.close()
+
+        if cached_file is not None:
+            download_result = True
+        else:
+            backup_stream = BackupCache.get_writer(backup_record, decompress_process.stdin)
+            download_result = Minio.download_stream(backup_file, backup_stream)
+
+            # Verify the content and publish the cache file
+            if isinstance(backup_stream, CacheWriter):
+                download_result = backup_stream.finish(download_result)
+
+            try:
+                decompress_process.stdin.close()
+            except OSError:
+                pass
+
+        return_codes = [decompress_process.wait(), unpack_process.wait()]
+
+        if any(return_codes) or not download_result:
+            logging.error("Unable to restore backup %s, return codes (%s, unpack) are %s, "
+                          "download=%s", backup_file, codec.name, return_codes, download_result)
+            return False
+
+        return True
@@ -0,0 +1,120 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import logging
+
+from datetime import datetime, timezone
+
+from mcm.binlog import BinlogArchive
+from mcm.catalog import BackupCatalog
+from mcm.consul import Consul
+from mcm.minio import Minio
+
+class RetentionPolicy:
+    """
+    A tiered (grandfather-father-son) retention policy for the backups.
+    All backups of the last hours, the newest backup of each day and
+    the newest backup of each week are kept. The backups a kept backup
+    is based on (full and incremental backups of the chain) and the
+    archived binlogs newer than the oldest kept backup are kept as well.
+    The expired backups are removed by the replication leader.
+    """
+
+    @staticmethod
+    def get_policy():
+        """
+        Get the retention periods
+        """
+        return {
+            'all_hours': int(os.getenv('MCM_RETENTION_ALL_HOURS', "24")),
+            'daily_days': int(os.getenv('MCM_RETENTION_DAILY_DAYS', "14")),
+            'weekly_weeks': int(os.getenv('MCM_RETENTION_WEEKLY_WEEKS', "13"))
+        }
+
+    @staticmethod
+    def get_retained_backups(records, current_time):
+        """
+        Get the names of the backups that are kept by the policy
+        """
+        policy = RetentionPolicy.get_policy()
+        records_by_name = {record['name']: record for record in records}
+        restorable = [record for record in records if BackupCatalog.is_restorable(record, records)]
+
+        retained = {record['name'] for record in records
+                    if current_time - record['timestamp'] <= policy['all_hours'] * 60 * 60}
+
+        # The newest backup of a day or week, full backups are preferred
+        # (an incremental backup keeps its complete backup chain)
+        daily_backups = {}
+        weekly_backups = {}
+
+        for record in sorted(restorable, key=lambda record: (record['type'] == 'full', record['timestamp'])):
+            age = current_time - record['timestamp']
+            backup_date = datetime.fromtimestamp(record['timestamp'], timezone.utc).date()
+
+            if age <= policy['daily_days'] * 24 * 60 * 60:
+                daily_backups[backup_date] = record['name']
+
+            if age <= policy['weekly_weeks'] * 7 * 24 * 60 * 60:
+                weekly_backups[backup_date.isocalendar()[:2]] = record['name']
+
+        retained.update(daily_backups.values())
+        retained.update(weekly_backups.values())
+
+        # The latest restorable backup is never removed
+        if restorable:
+            retained.add(max(restorable, key=lambda record: record['timestamp'])['name'])
+
+        # Keep the backups the retained backups are based on
+        for backup_name in list(retained):
+            record = records_by_name[backup_name]
+
+            while record.get('parent') in records_by_name:
+                retained.add(record['parent'])
+                record = records_by_name[record['parent']]
+
+        return retained
+
+    @staticmethod
+    def apply_if_needed():
+        """
+        Remove the backups and binlogs that are expired by the
+        policy (performed by the replication leader)
+        """
+        consul = Consul.get_instance()
+
+        if not consul.is_replication_leader():
+            return False
+
+        records = consul.get_backup_records()
+
+        if not records:
+            return False
+
+        retained = RetentionPolicy.get_retained_backups(records, time.time())
+        expired_backups = [record['name'] for record in records if record['name'] not in retained]
+
+        # Binlogs older than the oldest backup are not needed for a recovery (without
+        # a retained backup, e.g. only broken backup chains, the binlogs are kept)
+        oldest_backup = min((record['timestamp'] for record in records if record['name'] in retained),
+                            default=None)
+        expired_binlogs = [] if oldest_backup is None else \
+            [record for record in consul.get_binlog_records() if record['end_time'] < oldest_backup]
+
+        if not expired_backups and not expired_binlogs:
+            return False
+
+        logging.info("Retention policy keeps %i backups, removing %i backups and %i binlog files",
+                     len(retained), len(expired_backups), len(expired_binlogs))
+
+        # Remove the catalog entries first, so the backups are not restored anymore
+        if not consul.remove_backups_from_catalog(expired_backups) or \
+            not consul.remove_binlogs_from_index(expired_binlogs):
+            return False
+
+        object_names = [object_name for backup_name in expired_backups
+                        for object_name in (backup_name, f"{backup_name}.json")]
+        object_names.extend(BinlogArchive.get_object_name(record) for record in expired_binlogs)
+
+        return Minio.remove_objects(object_names)
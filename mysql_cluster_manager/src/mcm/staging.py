@@ -0,0 +1,184 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import glob
+import time
+import shutil
+import logging
+import threading
+
+
+class Staging:
+    """
+    The staging area for restores. The datadir is a subdirectory of the
+    MySQL volume. A backup is restored into a staging directory next to
+    the datadir and the staging directory is renamed into the datadir when
+    the restore is complete. The old datadir is renamed to an old datadir
+    next to it, so no data is copied between filesystems and the server
+    and xtrabackup never see the other directories. Old datadirs and
+    abandoned staging directories are removed by a background reaper.
+    """
+
+    # Bytes per second deleted by the reaper
+    delete_rate = 256 * 1024 * 1024
+
+    # Name prefixes of the staging directories and the old datadirs
+    staging_prefix = ".mcm_staging_"
+    old_prefix = ".mcm_old_"
+
+    # Entries of the volume that do not belong to a datadir
+    volume_entries = ("lost+found",)
+
+    @staticmethod
+    def get_retention():
+        """
+        Get the number of old datadirs that are kept
+        """
+        return int(os.getenv('MCM_OLD_DATADIR_RETENTION', "1"))
+
+    @staticmethod
+    def is_staging_entry(name):
+        """
+        Is the entry of the volume a staging directory or an old datadir
+        """
+        return name.startswith(Staging.staging_prefix) or name.startswith(Staging.old_prefix)
+
+    @staticmethod
+    def migrate_datadir(datadir):
+        """
+        Move a datadir that was created directly in the volume (the layout
+        of older versions) into the datadir subdirectory
+        """
+        volume = os.path.dirname(datadir)
+
+        if not os.path.isfile(f"{volume}/ib_logfile0"):
+            return False
+
+        # The redo log is moved last, so an interrupted migration is
+        # continued and the incomplete datadir is not used
+        entries = sorted((entry for entry in os.listdir(volume)
+                          if entry != os.path.basename(datadir) and entry not in Staging.volume_entries
+                          and not Staging.is_staging_entry(entry)),
+                         key=lambda entry: entry == "ib_logfile0")
+
+        logging.info("Moving the datadir of the volume %s into %s", volume, datadir)
+
+        if not os.path.isdir(datadir):
+            os.mkdir(datadir, 0o750)
+
+            if os.geteuid() == 0:
+                shutil.chown(datadir, "mysql", "mysql")
+
+        for entry in entries:
+            os.rename(f"{volume}/{entry}", f"{datadir}/{entry}")
+
+        return True
+
+    @staticmethod
+    def create(datadir):
+        """
+        Create a new staging directory next to the datadir
+        """
+        staging_dir = f"{os.path.dirname(datadir)}/{Staging.staging_prefix}{time.time()}"
+
+        os.makedirs(staging_dir, 0o750)
+        logging.info("Restoring into staging directory %s", staging_dir)
+
+        return staging_dir
+
+    @staticmethod
+    def swap(datadir, staging_dir):
+        """
+        Replace the datadir with the staging directory. Returns the
+        directory of the old data (None if there was no old data).
+        """
+        old_dir = Staging.move_away(datadir)
+
+        if os.path.isdir(datadir):
+            os.rmdir(datadir)
+
+        os.rename(staging_dir, datadir)
+
+        logging.info("Staging directory %s moved to the datadir", staging_dir)
+        return old_dir
+
+    @staticmethod
+    def move_away(datadir):
+        """
+        Rename a non empty datadir to an old datadir next to it. Returns
+        the directory (None if the datadir is missing or empty). The
+        directory is removed by the reaper, if no old datadirs are kept.
+        """
+        if not os.path.isdir(datadir) or not os.listdir(datadir):
+            return None
+
+        old_dir = f"{os.path.dirname(datadir)}/{Staging.old_prefix}{time.time()}"
+        os.rename(datadir, old_dir)
+
+        logging.info("Old MySQL data moved to: %s", old_dir)
+        return old_dir
+
+    @staticmethod
+    def get_expired_directories(datadir):
+        """
+        Get the staging directories and the old datadirs that exceed
+        the retention count
+        """
+        volume = os.path.dirname(datadir)
+
+        # The timestamp is part of the name
+        def get_timestamp(path):
+            return float(path.rsplit("_", 1)[1])
+
+        old_dirs = sorted(glob.glob(f"{volume}/{Staging.old_prefix}*"), key=get_timestamp,
+                          reverse=True)
+        staging_dirs = glob.glob(f"{volume}/{Staging.staging_prefix}*")
+
+        return staging_dirs + old_dirs[max(Staging.get_retention(), 0):]
+
+    @staticmethod
+    def start_reaper(datadir):
+        """
+        Remove the expired directories in a background thread
+        """
+        expired_dirs = Staging.get_expired_directories(datadir)
+
+        if not expired_dirs:
+            return
+
+        reaper_thread = threading.Thread(target=Staging.remove_directories, args=(expired_dirs,),
+                                         name="datadir-reaper", daemon=True)
+        reaper_thread.start()
+
+    @staticmethod
+    def remove_directories(directories):
+        """
+        Remove the directories, the deletion rate is bounded
+        """
+        for directory in directories:
+            logging.info("Removing %s", directory)
+            start_time = time.time()
+            deleted_bytes = 0
+
+            try:
+                for dirpath, dirnames, filenames in os.walk(directory, topdown=False):
+                    for filename in filenames:
+                        path = os.path.join(dirpath, filename)
+                        deleted_bytes = deleted_bytes + os.lstat(path).st_size
+                        os.remove(path)
+
+                        delay = deleted_bytes / Staging.delete_rate - (time.time() - start_time)
+                        if delay > 0:
+                            time.sleep(delay)
+
+                    for dirname in dirnames:
+                        path = os.path.join(dirpath, dirname)
+
+                        if os.path.islink(path):
+                            os.remove(path)
+                        else:
+                            os.rmdir(path)
+
+                os.rmdir(directory)
+            except OSError as error:
+                logging.warning("Unable to remove %s: %s", directory, error)
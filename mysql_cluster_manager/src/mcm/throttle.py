@@ -0,0 +1,238 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import time
+import signal
+import logging
+import threading
+
+import mysql.connector
+
+from mcm.metrics import Metrics
+
+
+class BackupThrottle:
+    """
+    Adapt the speed of a running backup to the load of the server. The
+    load (threads running, pending InnoDB I/O, replication lag, and the
+    p99 statement latency) is sampled periodically. The backup process
+    is paused (SIGSTOP) while the server is overloaded and resumed
+    (SIGCONT) when the load is back below half of the limits.
+    """
+
+    # Interval of the load samples in seconds
+    sample_interval = 1
+
+    def __init__(self, process, query_function):
+        """
+        Init the throttle for the process. The query_function executes
+        a SQL query on the local server and returns the rows as dicts.
+        """
+        self.process = process
+        self.query_function = query_function
+        self.paused_since = None
+        self.paused_seconds = 0
+        self.pause_allowed_at = 0
+        self.latency_histogram = None
+        self.run_thread = False
+        self.thread = None
+
+    @staticmethod
+    def is_enabled():
+        """
+        Is the adaptive throttling enabled (MCM_BACKUP_THROTTLE_ADAPTIVE)
+        """
+        return os.getenv('MCM_BACKUP_THROTTLE_ADAPTIVE', "true").lower() == "true"
+
+    @staticmethod
+    def get_limits():
+        """
+        Get the load limits, a backup is paused if a limit is exceeded
+        """
+        return {
+            'threads_running': float(os.getenv('MCM_BACKUP_MAX_THREADS_RUNNING', "32")),
+            'pending_io': float(os.getenv('MCM_BACKUP_MAX_PENDING_IO', "64")),
+            'replication_lag': float(os.getenv('MCM_BACKUP_MAX_REPLICATION_LAG', "60")),
+            'p99_latency_ms': float(os.getenv('MCM_BACKUP_LATENCY_BUDGET_MS', "100"))
+        }
+
+    @staticmethod
+    def get_max_pause():
+        """
+        Get the maximal duration of a pause. xtrabackup has to copy the redo
+        log before it is overwritten, so the backup cannot be paused forever.
+        """
+        return float(os.getenv('MCM_BACKUP_MAX_PAUSE', "30"))
+
+    @staticmethod
+    def get_min_run():
+        """
+        Get the time the backup runs at least after a pause was ended by
+        MCM_BACKUP_MAX_PAUSE, so the backup makes progress under steady load
+        """
+        return float(os.getenv('MCM_BACKUP_MIN_RUN', "10"))
+
+    @staticmethod
+    def get_priority_command(command):
+        """
+        Run the command with a low CPU and I/O priority
+        """
+        io_class = os.getenv('MCM_BACKUP_IO_CLASS', "2")
+        return ["/usr/bin/ionice", f"-c{io_class}", "-n7", "/usr/bin/nice", "-n10"] + command
+
+    @staticmethod
+    def get_throttle_option():
+        """
+        Get the static I/O limit for xtrabackup (MCM_BACKUP_THROTTLE, number
+        of 10 MiB chunks copied per second, unset = unlimited)
+        """
+        throttle = os.getenv('MCM_BACKUP_THROTTLE')
+
+        if throttle is None:
+            return []
+
+        return [f"--throttle={int(throttle)}"]
+
+    def start(self):
+        """
+        Start the throttle thread
+        """
+        if not BackupThrottle.is_enabled():
+            return
+
+        self.run_thread = True
+        self.thread = threading.Thread(target=self.run, name="backup-throttle", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the throttle thread and resume the process
+        """
+        self.run_thread = False
+
+        if self.thread is not None:
+            self.thread.join()
+
+        self.resume()
+        return self.paused_seconds
+
+    def pause(self):
+        """
+        Pause the backup process
+        """
+        if self.paused_since is not None or self.process.poll() is not None:
+            return
+
+        self.process.send_signal(signal.SIGSTOP)
+        self.paused_since = time.time()
+        Metrics.backup_throttle_pauses.inc()
+
+    def resume(self):
+        """
+        Resume the backup process
+        """
+        if self.paused_since is None:
+            return
+
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGCONT)
+
+        pause_duration = time.time() - self.paused_since
+        self.paused_seconds = self.paused_seconds + pause_duration
+        Metrics.backup_throttle_seconds.inc(pause_duration)
+        self.paused_since = None
+
+    def run(self):
+        """
+        Sample the load and pause or resume the backup process
+        """
+        limits = BackupThrottle.get_limits()
+
+        while self.run_thread and self.process.poll() is None:
+            time.sleep(BackupThrottle.sample_interval)
+
+            try:
+                load = self.get_load()
+            except mysql.connector.Error as err:
+                logging.warning("Unable to sample the server load: %s", err)
+                continue
+
+            overloaded = [name for name, value in load.items()
+                          if value is not None and value > limits[name]]
+
+            if self.paused_since is None:
+                if overloaded and time.time() >= self.pause_allowed_at:
+                    logging.info("Server is overloaded (%s), pausing backup", overloaded)
+                    self.pause()
+
+                continue
+
+            # Resume with hysteresis
+            if all(value is None or value <= limits[name] / 2 for name, value in load.items()):
+                logging.info("Resuming backup (load=%s)", load)
+                self.resume()
+
+            # Resume to let xtrabackup copy the redo log
+            elif time.time() - self.paused_since > BackupThrottle.get_max_pause():
+                logging.info("Backup paused for too long, resuming (load=%s)", load)
+                self.resume()
+                self.pause_allowed_at = time.time() + BackupThrottle.get_min_run()
+
+    def get_load(self):
+        """
+        Get the current load of the server
+        """
+        status = {row['Variable_name']: row['Value'] for row in self.query_function(
+            "SHOW GLOBAL STATUS WHERE Variable_name IN ('Threads_running', "
+            "'Innodb_data_pending_reads', 'Innodb_data_pending_writes', "
+            "'Innodb_data_pending_fsyncs')")}
+
+        slave_status = self.query_function("SHOW SLAVE STATUS")
+        replication_lag = None
+
+        if slave_status:
+            replication_lag = slave_status[0]['Seconds_Behind_Master']
+
+        return {
+            'threads_running': int(status['Threads_running']),
+            'pending_io': sum(int(status[name]) for name in (
+                'Innodb_data_pending_reads', 'Innodb_data_pending_writes',
+                'Innodb_data_pending_fsyncs')),
+            'replication_lag': replication_lag,
+            'p99_latency_ms': self.get_p99_latency()
+        }
+
+    def get_p99_latency(self):
+        """
+        Get the p99 latency (in ms) of the statements executed since the
+        last sample, based on the statement histogram of the performance
+        schema. None is returned if no statement was executed.
+        """
+        rows = self.query_function("SELECT BUCKET_TIMER_HIGH, COUNT_BUCKET FROM "
+                                   "performance_schema.events_statements_histogram_global "
+                                   "ORDER BY BUCKET_NUMBER")
+
+        histogram = [(row['BUCKET_TIMER_HIGH'], row['COUNT_BUCKET']) for row in rows]
+        last_histogram = self.latency_histogram
+        self.latency_histogram = histogram
+
+        if last_histogram is None or len(last_histogram) != len(histogram):
+            return None
+
+        deltas = [(timer_high, count - last_count) for (timer_high, count), (_, last_count)
+                  in zip(histogram, last_histogram)]
+
+        total = sum(count for _, count in deltas)
+
+        if total <= 0:
+            return None
+
+        seen = 0
+        for timer_high, count in deltas:
+            seen = seen + count
+
+            # The timer is measured in picoseconds
+            if seen >= total * 0.99:
+                return timer_high / 1000000000
+
+        return None
@@ -1,14 +1,11 @@
 """This file contains the utils of the cluster manager"""
 
 import os
-import time
 
 from datetime import datetime
 
 import netifaces
 
-from mcm.minio import Minio
-
 
 class Utils:
     """
@@ -24,6 +21,23 @@ class Utils:
         interface = os.getenv('MCM_BIND_INTERFACE', "eth0")
         return netifaces.ifaddresses(interface)[netifaces.AF_INET][0]["addr"]
 
+    @staticmethod
+    def get_directory_size(directory):
+        """
+        Get the size of all files in the directory (recursive)
+        """
+        size = 0
+
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                try:
+                    size = size + os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    # File removed in the meantime
+                    pass
+
+        return size
+
     @staticmethod
     def is_refresh_needed(last_execution, max_timedelta):
         """
@@ -35,23 +49,40 @@ class Utils:
         return datetime.now() - last_execution > max_timedelta
 
     @staticmethod
-    def wait_for_backup_exists(consul):
+    def run_as_user(username, command):
         """
-        Wait for a backup to be occour
+        Prefix the command, so that it is executed as the given user
         """
 
-        Minio.setup_connection()
+        # Running as unprivileged user, no switch possible
+        if os.geteuid() != 0:
+            return command
 
-        retry_counter = 100
+        return ["/usr/local/bin/gosu", username] + command
 
-        for _ in range(retry_counter):
-            backup_exists = Minio.does_backup_exists()
 
-            if backup_exists:
-                return True
+class MeteredStream:
+    """
+    A readable stream that counts the read bytes and updates
+    an optional checksum (e.g., hashlib.sha256()) with the read data
+    """
+
+    def __init__(self, stream, checksum=None):
+        """
+        Init the stream
+        """
+        self.stream = stream
+        self.checksum = checksum
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        """
+        Read data from the wrapped stream
+        """
+        chunk = self.stream.read(size)
+        self.read_bytes = self.read_bytes + len(chunk)
 
-        # Keep consul sessions alive
-        consul.refresh_sessions()
-        time.sleep(5000)
+        if self.checksum is not None:
+            self.checksum.update(chunk)
 
-        return False
+        return chunk
@@ -0,0 +1,177 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import glob
+import time
+import logging
+import tempfile
+import subprocess
+
+from shutil import rmtree
+
+from mcm.catalog import BackupCatalog
+from mcm.consul import Consul
+from mcm.metrics import Metrics
+from mcm.mysql import Mysql
+from mcm.restore import BackupRestore
+from mcm.throttle import BackupThrottle
+from mcm.utils import Utils
+from mcm.xtrabackup import Xtrabackup
+
+class BackupVerification:
+    """
+    Verify the backups by a test restore. The latest unverified backup
+    is restored into a scratch directory with a low priority: the objects
+    are checked against their checksums, the backup chain is prepared,
+    and the pages of the tablespaces are validated with innochecksum.
+    The result is recorded in the backup catalog, so corrupt backups are
+    skipped by restores.
+    """
+
+    innochecksum_binary = "/usr/bin/innochecksum"
+
+    # Number of tablespaces checked by one innochecksum call
+    innochecksum_batch_size = 100
+
+    @staticmethod
+    def is_enabled():
+        """
+        Is the backup verification enabled (MCM_BACKUP_VERIFY)
+        """
+        return os.getenv('MCM_BACKUP_VERIFY', "true").lower() == "true"
+
+    @staticmethod
+    def get_directory():
+        """
+        Get the directory for the scratch directories of the test restores
+        """
+        return os.getenv('MCM_BACKUP_VERIFY_DIR', "/tmp")
+
+    @staticmethod
+    def get_unverified_backup():
+        """
+        Get the record of the latest backup that is not verified
+        (None if all restorable backups are verified)
+        """
+        records = Consul.get_instance().get_backup_records()
+
+        unverified = [record for record in records
+                      if BackupCatalog.get_verification_status(record) is None
+                      and BackupCatalog.is_restorable(record, records)]
+
+        return max(unverified, key=lambda record: record['timestamp'], default=None)
+
+    @staticmethod
+    def verify_if_needed():
+        """
+        Verify the latest unverified backup. The verification is performed
+        by the node that creates the backups. It holds its own lock, so
+        backups are not delayed by a long running verification.
+        """
+        if not BackupVerification.is_enabled():
+            return False
+
+        record = BackupVerification.get_unverified_backup()
+
+        if record is None:
+            return False
+
+        backup_node = Mysql.get_backup_node(BackupCatalog.get_latest_backup())
+
+        if backup_node != Utils.get_local_ip_address():
+            logging.debug("Backup is verified by %s, skipping verification", backup_node)
+            return False
+
+        consul = Consul.get_instance()
+
+        if not consul.try_to_acquire_backup_lock(Consul.verification_lock_key):
+            logging.debug("Verification lock is held by another node, skipping verification")
+            return False
+
+        try:
+            return BackupVerification.verify_backup(record)
+        finally:
+            consul.release_backup_lock(Consul.verification_lock_key)
+
+    @staticmethod
+    def verify_backup(record):
+        """
+        Restore the backup into a scratch directory, validate it and record
+        the result in the catalog. Returns True if the backup is verified.
+        """
+        logging.info("Verifying backup %s", record['name'])
+        start_time = time.time()
+
+        try:
+            scratch_dir = tempfile.mkdtemp(prefix="mysql_verify_",
+                                           dir=BackupVerification.get_directory())
+        except OSError as error:
+            logging.error("Unable to create scratch directory for the verification: %s", error)
+            return False
+
+        try:
+            verified = BackupVerification.restore_and_validate(record, scratch_dir)
+        finally:
+            rmtree(scratch_dir, ignore_errors=True)
+
+        duration = time.time() - start_time
+        status = "verified" if verified else "corrupt"
+
+        if verified:
+            logging.info("Backup %s was verified (duration=%.1fs)", record['name'], duration)
+        else:
+            logging.error("Backup %s is corrupt (duration=%.1fs)", record['name'], duration)
+
+        BackupCatalog.record_verification(record, status, duration)
+        Metrics.backup_verifications.labels(status).inc()
+        Metrics.backup_verification_duration.set(duration)
+
+        return verified
+
+    @staticmethod
+    def restore_and_validate(record, scratch_dir):
+        """
+        Restore the backup chain into the scratch directory and validate
+        the restored data
+        """
+        backup_chain = BackupRestore.get_backup_chain(record['name'])
+
+        if backup_chain is None:
+            logging.error("Unable to determine the backup chain of %s", record['name'])
+            return False
+
+        if BackupRestore.restore_backup_chain(backup_chain, scratch_dir, low_priority=True) is None:
+            return False
+
+        # The prepared data has to match the LSN of the backup
+        checkpoints = Xtrabackup.read_checkpoints(scratch_dir)
+
+        if 'to_lsn' in record and (checkpoints is None or checkpoints.get('to_lsn') != record['to_lsn']):
+            logging.error("LSN of the restored backup does not match (expected %s, got %s)",
+                          record['to_lsn'], None if checkpoints is None else checkpoints.get('to_lsn'))
+            return False
+
+        return BackupVerification.validate_tablespaces(scratch_dir)
+
+    @staticmethod
+    def validate_tablespaces(directory):
+        """
+        Validate the page checksums of all tablespaces with innochecksum
+        """
+        tablespaces = sorted(glob.glob(f"{directory}/ibdata*") + glob.glob(f"{directory}/undo_*")
+                             + glob.glob(f"{directory}/**/*.ibd", recursive=True))
+
+        logging.debug("Validating the checksums of %i tablespaces", len(tablespaces))
+
+        for position in range(0, len(tablespaces), BackupVerification.innochecksum_batch_size):
+            batch = tablespaces[position:position + BackupVerification.innochecksum_batch_size]
+            innochecksum = BackupThrottle.get_priority_command(
+                [BackupVerification.innochecksum_binary] + batch)
+
+            result = subprocess.run(innochecksum, stdout=subprocess.DEVNULL, check=False)
+
+            if result.returncode != 0:
+                logging.error("Checksum validation failed for tablespaces %s", batch)
+                return False
+
+        return True
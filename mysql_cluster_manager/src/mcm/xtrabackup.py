@@ -0,0 +1,176 @@
+"""This file is part of the MySQL cluster manager"""
+
+import os
+import re
+import logging
+
+from mcm.resources import Resources
+
+
+class Xtrabackup:
+    """
+    This class encapsulates all XtraBackup related things
+    """
+
+    xtrabackup_binary = "/usr/bin/xtrabackup"
+    xbstream_binary = "/usr/bin/xbstream"
+
+    @staticmethod
+    def get_backup_parallel():
+        """
+        Get the number of threads that copy the data files during a backup.
+        The server is running, so half of the CPUs are used by default.
+        """
+        parallel = os.getenv('MCM_BACKUP_PARALLEL')
+
+        if parallel is not None:
+            return int(parallel)
+
+        return min(max(Resources.get_cpus() // 2, 1), 16)
+
+    @staticmethod
+    def get_restore_parallel(low_priority=False):
+        """
+        Get the number of threads used by unpack and prepare. The server
+        is not running during a restore, so all CPUs are used by default.
+        A low priority restore (e.g., a verification next to the running
+        server) uses MCM_BACKUP_VERIFY_PARALLEL threads (default 1).
+        """
+        if low_priority:
+            return int(os.getenv('MCM_BACKUP_VERIFY_PARALLEL', "1"))
+
+        parallel = os.getenv('MCM_RESTORE_PARALLEL')
+
+        if parallel is not None:
+            return int(parallel)
+
+        return min(Resources.get_cpus(), 32)
+
+    @staticmethod
+    def get_prepare_memory(low_priority=False):
+        """
+        Get the memory used by prepare for the buffer pool (e.g., 4G). The
+        server is not running during a restore, so half of the memory is
+        used by default (the default of xtrabackup is 100 MiB). A low
+        priority restore uses MCM_BACKUP_VERIFY_USE_MEMORY (default 256M).
+        """
+        if low_priority:
+            return os.getenv('MCM_BACKUP_VERIFY_USE_MEMORY', "256M")
+
+        memory = os.getenv('MCM_RESTORE_USE_MEMORY')
+
+        if memory is not None:
+            return memory
+
+        memory_mib = max(Resources.get_memory() // 2 // (1024 * 1024), 128)
+        return f"{memory_mib}M"
+
+    @staticmethod
+    def get_backup_command(lsn_dir, incremental_lsn=None):
+        """
+        Get the command to stream a backup (xbstream) to stdout. The
+        metadata of the backup is also stored in the lsn_dir.
+        """
+        backup_user = os.environ.get("MYSQL_BACKUP_USER")
+        backup_password = os.environ.get("MYSQL_BACKUP_PASSWORD")
+
+        command = [Xtrabackup.xtrabackup_binary, f"--user={backup_user}",
+                   f"--password={backup_password}", "--backup",
+                   "--stream=xbstream", f"--target-dir={lsn_dir}",
+                   f"--extra-lsndir={lsn_dir}", "--slave-info",
+                   f"--parallel={Xtrabackup.get_backup_parallel()}"]
+
+        if incremental_lsn is not None:
+            command.append(f"--incremental-lsn={incremental_lsn}")
+
+        return command
+
+    @staticmethod
+    def get_prepare_command(target_dir, incremental_dir=None, apply_log_only=False,
+                            low_priority=False):
+        """
+        Get the command to prepare a backup. With apply_log_only,
+        further incremental backups can be applied afterwards.
+        """
+        command = [Xtrabackup.xtrabackup_binary, "--prepare",
+                   f"--target-dir={target_dir}",
+                   f"--use-memory={Xtrabackup.get_prepare_memory(low_priority)}",
+                   f"--parallel={Xtrabackup.get_restore_parallel(low_priority)}"]
+
+        if apply_log_only:
+            command.append("--apply-log-only")
+
+        if incremental_dir is not None:
+            command.append(f"--incremental-dir={incremental_dir}")
+
+        return command
+
+    @staticmethod
+    def get_unpack_command(target_dir, low_priority=False):
+        """
+        Get the command to unpack a xbstream from stdin
+        """
+        return [Xtrabackup.xbstream_binary, "-x", "-C", target_dir,
+                f"--parallel={Xtrabackup.get_restore_parallel(low_priority)}"]
+
+    @staticmethod
+    def read_binlog_info(lsn_dir):
+        """
+        Read the binlog position and the executed GTIDs of the backed up
+        server from the xtrabackup_info file of a backup
+
+        binlog_pos = filename 'binlog.000003', position '156', GTID of the last change 'uuid:1-10'
+        """
+        filename = f"{lsn_dir}/xtrabackup_info"
+
+        if not os.path.isfile(filename):
+            logging.error("Backup info file %s not found", filename)
+            return None
+
+        with open(filename, encoding="utf-8") as info_file:
+            for line in info_file:
+                if not line.startswith("binlog_pos"):
+                    continue
+
+                binlog_file = re.search(r"filename '([^']*)'", line)
+                binlog_position = re.search(r"position '([^']*)'", line)
+                gtid_executed = re.search(r"GTID of the last change '([^']*)'", line)
+
+                return {
+                    'binlog_file': binlog_file.group(1) if binlog_file else None,
+                    'binlog_position': int(binlog_position.group(1)) if binlog_position else None,
+                    'gtid_executed': gtid_executed.group(1) if gtid_executed else None
+                }
+
+        return {'binlog_file': None, 'binlog_position': None, 'gtid_executed': None}
+
+    @staticmethod
+    def read_checkpoints(lsn_dir):
+        """
+        Read the xtrabackup_checkpoints file of a backup
+
+        backup_type = full-backuped
+        from_lsn = 0
+        to_lsn = 18256782
+        last_lsn = 18256791
+        """
+        checkpoints = {}
+        filename = f"{lsn_dir}/xtrabackup_checkpoints"
+
+        if not os.path.isfile(filename):
+            logging.error("Checkpoint file %s not found", filename)
+            return None
+
+        with open(filename, encoding="utf-8") as checkpoint_file:
+            for line in checkpoint_file:
+                if "=" not in line:
+                    continue
+
+                key, value = line.split("=", 1)
+                checkpoints[key.strip()] = value.strip()
+
+        for key in ("from_lsn", "to_lsn", "last_lsn"):
+            if key in checkpoints:
+                checkpoints[key] = int(checkpoints[key])
+
+        return checkpoints
@@ -7,7 +7,11 @@ import sys
 import logging
 import argparse
 
+from datetime import datetime, timezone
+
 from mcm.actions import Actions
+from mcm.benchmark import Benchmark
+from mcm.binlog import BinlogArchive
 from mcm.consul import Consul
 from mcm.mysql import Mysql
 from mcm.proxysql import Proxysql
@@ -16,12 +20,20 @@ parser = argparse.ArgumentParser(
     description="MySQL cluster manager",
     epilog="For more info, please see: https://github.com/jnidzwetzki/mysql-ha-cloud")
 
-AVAILABLE_OPERATIONS = "(join_or_bootstrap, mysql_backup, mysql_restore, mysql_start, mysql_stop)"
+AVAILABLE_OPERATIONS = "(join_or_bootstrap, mysql_backup, mysql_restore, mysql_restore_pitr, mysql_start, mysql_stop, codec_benchmark, replication_benchmark)"
 parser.add_argument('operation', metavar='operation',
                     help=f'Operation to be executed {AVAILABLE_OPERATIONS}')
 
 log_levels = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
 parser.add_argument('--log-level', default='INFO', choices=log_levels)
+parser.add_argument('--sample-size', default=256, type=int,
+                    help='Size of the datadir sample for the codec benchmark in MiB')
+parser.add_argument('--transactions', default=20000, type=int,
+                    help='Number of transactions for the replication benchmark')
+parser.add_argument('--until-time', default=None,
+                    help='Point-in-time recovery target (UTC, YYYY-MM-DD HH:MM:SS)')
+parser.add_argument('--until-gtid', default=None,
+                    help='Point-in-time recovery target (GTID set)')
 
 # Parse args
 args = parser.parse_args()
@@ -48,16 +60,28 @@ elif args.operation == 'mysql_backup':
     Mysql.backup_data()
 elif args.operation == 'mysql_restore':
     Mysql.restore_backup()
+elif args.operation == 'mysql_restore_pitr':
+    until_time = None
+    if args.until_time is not None:
+        until_time = datetime.strptime(args.until_time, "%Y-%m-%d %H:%M:%S") \
+            .replace(tzinfo=timezone.utc).timestamp()
+    if not BinlogArchive.restore_to(until_time, args.until_gtid):
+        sys.exit(1)
 elif args.operation == 'mysql_start':
     Mysql.server_start()
 elif args.operation == 'mysql_stop':
     Mysql.server_stop()
 elif args.operation == 'mysql_autobackup':
     Mysql.create_backup_if_needed()
+elif args.operation == 'codec_benchmark':
+    Benchmark.run_codec_benchmark(Mysql.mysql_datadir, args.sample_size * 1024 * 1024)
+elif args.operation == 'replication_benchmark':
+    Benchmark.run_replication_benchmark(args.transactions)
 elif args.operation == 'proxysql_init':
     Proxysql.inital_setup()
-    nodes = Consul.get_instance().get_all_registered_nodes()
-    Proxysql.set_mysql_server(nodes)
+    node_records = Consul.get_instance().get_all_registered_node_records()
+    leader_ip = Consul.get_instance().get_replication_leader_ip()
+    Proxysql().set_mysql_server(node_records, leader_ip)
 else:
     logging.error("Unknown operation: %s", {args.operation})
     sys.exit(1)
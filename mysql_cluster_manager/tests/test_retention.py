@@ -0,0 +1,45 @@
+"""Tests of the backup retention policy"""
+
+import os
+import sys
+import time
+import unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mcm.retention import RetentionPolicy # pylint: disable=wrong-import-position
+
+class RetentionPolicyTest(unittest.TestCase):
+    """
+    Test the removal of the expired backups and binlogs
+    """
+
+    def test_no_retained_backup(self):
+        """
+        Backups older than the weekly window with broken chains are
+        removed, the binlogs are kept
+        """
+        timestamp = time.time() - 200 * 24 * 60 * 60
+        records = [{'name': "full", 'type': "full", 'timestamp': timestamp,
+                    'verification': {'status': "corrupt"}},
+                   {'name': "incremental", 'type': "incremental", 'timestamp': timestamp + 60,
+                    'parent': "full"}]
+
+        consul = mock.Mock()
+        consul.is_replication_leader.return_value = True
+        consul.get_backup_records.return_value = records
+        consul.get_binlog_records.return_value = [{'end_time': timestamp}]
+
+        with mock.patch("mcm.retention.Consul.get_instance", return_value=consul), \
+            mock.patch("mcm.retention.Minio.remove_objects", return_value=True) as remove_objects:
+
+            self.assertTrue(RetentionPolicy.apply_if_needed())
+
+        consul.remove_backups_from_catalog.assert_called_once_with(["full", "incremental"])
+        consul.remove_binlogs_from_index.assert_called_once_with([])
+        remove_objects.assert_called_once_with(["full", "full.json", "incremental", "incremental.json"])
+
+if __name__ == '__main__':
+    unittest.main()